@@ -0,0 +1,418 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from typing import Callable
+
+FORMULA_TEMPLATES = [
+    lambda r: f"\\frac{{{r.randint(1, 9)}}}{{{r.randint(2, 12)}}}",
+    lambda r: f"{r.randint(2, 99)} \\times {r.randint(2, 9)} = {r.randint(10, 999)}",
+    lambda r: f"{r.randint(100, 9999)} \\div {r.randint(2, 9)}",
+    lambda r: f"{r.randint(2, 9)}^{r.randint(2, 3)}",
+    lambda r: f"{r.randint(10, 180)}^\\circ",
+    lambda r: f"\\sqrt{{{r.randint(2, 200)}}}",
+]
+
+TEXT_SNIPPETS = [
+    "一條巧克力蛋糕被平分成 8 片",
+    "請問下列何者正確",
+    "媽媽把一個鳳梨切成 5 片",
+    "計算下列算式的值",
+    "選項 A 正確的原因是",
+    "因此答案為",
+]
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+STARTUP_MODULES = [
+    "test_docx",
+    "test_docx_equation",
+    "test_docx_batch",
+    "test_pdf",
+    "test_pdf_from_docx",
+    "test_odt_change_formula_color",
+]
+
+
+def synthesize_text(rng: random.Random, latex_density: float, parts: int = 3) -> str:
+    # `latex_density` is the probability that each text part is followed by an inline formula
+    text = ""
+    for _ in range(parts):
+        text += rng.choice(TEXT_SNIPPETS)
+        if rng.random() < latex_density:
+            text += f" ${rng.choice(FORMULA_TEMPLATES)(rng)}$ "
+    return text
+
+
+def synthesize_quizzes_data(size: int, latex_density: float, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    quizzes = []
+    for _ in range(size):
+        quiz_type = "mcq" if rng.random() < 0.7 else "saq"
+        quizzes.append(
+            {
+                "quiz_type": quiz_type,
+                "quiz_category": rng.choice(["basic-concept", "other"]),
+                "source": "ai",
+                "question": synthesize_text(rng, latex_density),
+                "options": [synthesize_text(rng, latex_density, parts=1) for _ in range(4)] if quiz_type == "mcq" else [],
+                "explanation": synthesize_text(rng, latex_density, parts=4),
+                "answer": rng.randint(0, 3) if quiz_type == "mcq" else 0,
+            }
+        )
+    return {
+        "academic_year": 113,
+        "level": "junior",
+        "grade": "三",
+        "semester": "上",
+        "subject": "數學",
+        "chapter": "1",
+        "title": "分數的基本概念",
+        "quizzes": quizzes,
+    }
+
+
+def iter_quiz_texts(quizzes_data: dict):
+    for quiz in quizzes_data["quizzes"]:
+        yield quiz["question"]
+        yield from quiz["options"]
+        yield quiz["explanation"]
+
+
+# Each benchmark takes the synthesized payload and returns (items per iteration, function running one iteration)
+
+
+def bench_load_json(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_docx import Quizzes
+
+    payload = json.dumps(quizzes_data, ensure_ascii=False)
+    return len(quizzes_data["quizzes"]), lambda: Quizzes(**json.loads(payload))
+
+
+def bench_load_validate_json(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_docx import Quizzes
+
+    payload = json.dumps(quizzes_data, ensure_ascii=False).encode("utf-8")
+    return len(quizzes_data["quizzes"]), lambda: Quizzes.model_validate_json(payload)
+
+
+def bench_iter_quizzes(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_docx import iter_quizzes
+
+    quizzes_file = write_temp_json(quizzes_data)
+    return len(quizzes_data["quizzes"]), lambda: sum(1 for _ in iter_quizzes(quizzes_file))
+
+
+def bench_compact_bank(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_docx import CompactQuizBank
+
+    quizzes_file = write_temp_json(quizzes_data)
+    return len(quizzes_data["quizzes"]), lambda: CompactQuizBank.from_file(quizzes_file)
+
+
+def bench_docx_render(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_docx import Quizzes, render_document
+
+    quizzes = Quizzes(**quizzes_data)
+
+    def run():
+        render_document(quizzes, "template.docx").save(io.BytesIO())
+
+    return len(quizzes.quizzes), run
+
+
+def bench_add_text_with_latex(quizzes_data: dict, module_name: str) -> tuple[int, Callable[[], None]]:
+    from docx import Document
+
+    module = importlib.import_module(module_name)
+    texts = list(iter_quiz_texts(quizzes_data))
+
+    def run():
+        document = Document()
+        for text in texts:
+            module.add_text_with_latex(text, document.add_paragraph())
+
+    return len(texts), run
+
+
+def bench_pdf(quizzes_data: dict) -> tuple[int, Callable[[], None]]:
+    from test_pdf import generate_pdf, latex_image_cache
+
+    # Start every case from an empty disk cache so results do not depend on earlier runs
+    latex_image_cache.cache_dir = tempfile.mkdtemp(prefix="bench_latex_images_")
+    _temp_paths.append(latex_image_cache.cache_dir)
+
+    def run():
+        generate_pdf(quizzes_data, output_path=io.BytesIO())
+
+    return len(quizzes_data["quizzes"]), run
+
+
+def bench_odt(odt_file: str) -> tuple[int, Callable[[], None]]:
+    from test_odt_change_formula_color import FormulaColor, fix_odt_formula_style
+
+    work_dir = tempfile.mkdtemp(prefix="bench_odt_")
+    _temp_paths.append(work_dir)
+    work_file = os.path.join(work_dir, os.path.basename(odt_file))
+    shutil.copyfile(odt_file, work_file)
+
+    def run():
+        # The output (<name>_modified.odt) is written next to the copy, inside the work directory
+        with contextlib.redirect_stdout(io.StringIO()):
+            fix_odt_formula_style(work_file, FormulaColor.RED)
+
+    return 1, run
+
+
+_temp_paths: list[str] = []
+
+
+def write_temp_json(data: dict) -> str:
+    fd, path = tempfile.mkstemp(prefix="bench_quizzes_", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    _temp_paths.append(path)
+    return path
+
+
+BENCHMARKS: dict[str, Callable[..., tuple[int, Callable[[], None]]]] = {
+    "load_json": bench_load_json,
+    "load_validate_json": bench_load_validate_json,
+    "iter_quizzes": bench_iter_quizzes,
+    "compact_bank": bench_compact_bank,
+    "docx_render": bench_docx_render,
+    "latex_test_docx": lambda data: bench_add_text_with_latex(data, "test_docx"),
+    "latex_test_docx_equation": lambda data: bench_add_text_with_latex(data, "test_docx_equation"),
+    "pdf_generate": bench_pdf,
+}
+SIZE_INDEPENDENT_BENCHMARKS = {"odt_fix_formula_style"}
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(name: str, size: int | None, latex_density: float, repeat: int, seed: int, odt_file: str) -> dict:
+    # Runs in a fresh process so that peak RSS belongs to this case alone
+    result = {"name": name, "size": size, "latex_density": latex_density, "repeat": repeat}
+    try:
+        if name == "odt_fix_formula_style":
+            items, run = bench_odt(odt_file)
+        else:
+            items, run = BENCHMARKS[name](synthesize_quizzes_data(size, latex_density, seed))
+
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            latencies.append(time.perf_counter() - start)
+
+        total = sum(latencies)
+        result.update(
+            {
+                "items": items,
+                "total_s": total,
+                "first_ms": latencies[0] * 1000,
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "throughput_per_s": items * repeat / total if total > 0 else 0.0,
+                "peak_rss_mb": peak_rss_mb(),
+                "error": None,
+            }
+        )
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+    finally:
+        for path in _temp_paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+    return result
+
+
+def measure_startup(module: str, top: int = 5) -> dict:
+    # Import the module in a fresh interpreter with -X importtime, which reports
+    # "import time: self [us] | cumulative | imported package" for every module on stderr
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+
+    # Children are printed before their parent and indented by two spaces per level, so the module's direct
+    # imports are the depth-1 records between the previous top-level record and the module itself
+    direct_imports = []
+    import_ms = None
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        record = {"module": name.strip(), "cumulative_ms": int(cumulative_us) / 1000}
+        if depth == 0:
+            if record["module"] == module:
+                import_ms = record["cumulative_ms"]
+                break
+            direct_imports = []
+        elif depth == 1:
+            direct_imports.append(record)
+
+    result = {"module": module, "wall_ms": wall * 1000, "import_ms": import_ms, "heaviest": [], "error": None}
+    if completed.returncode != 0:
+        result["error"] = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "import failed"
+        return result
+    result["heaviest"] = sorted(direct_imports, key=lambda record: record["cumulative_ms"], reverse=True)[:top]
+    return result
+
+
+def run_startup(modules: list[str]) -> list[dict]:
+    results = []
+    for module in modules:
+        result = measure_startup(module)
+        results.append(result)
+        if result["error"]:
+            print(f"import {module}: failed ({result['error']})")
+            continue
+        print(f"import {module}: {result['import_ms']:.1f}ms (interpreter wall {result['wall_ms']:.1f}ms)")
+        for record in result["heaviest"]:
+            print(f"    {record['module']}: {record['cumulative_ms']:.1f}ms")
+    return results
+
+
+def compare_results(results: list[dict], baseline_file: str, threshold: float) -> list[str]:
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"], r["latex_density"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result["name"], result["size"], result["latex_density"]))
+        if previous is None or result["error"] or previous.get("error"):
+            continue
+        ratio = result["p50_ms"] / previous["p50_ms"] if previous["p50_ms"] > 0 else 1.0
+        line = f"{result['name']} size={result['size']}: p50 {previous['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms ({ratio:.2f}x)"
+        print(line)
+        if ratio > 1 + threshold:
+            regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the docx/pdf/odt generation hot paths.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="quiz bank sizes")
+    parser.add_argument("--latex-density", type=float, default=0.5, help="chance of a formula per text part (0-1)")
+    parser.add_argument("--repeat", type=int, default=5, help="iterations per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=[*BENCHMARKS, *SIZE_INDEPENDENT_BENCHMARKS],
+        default=None,
+        help="benchmarks to run (default: all)",
+    )
+    parser.add_argument("--odt", default="test_odt.odt", help="ODT file for the formula style benchmark")
+    parser.add_argument("-o", "--output", default="bench_output.json", help="JSON results file")
+    parser.add_argument("--compare", default=None, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown before failing")
+    parser.add_argument(
+        "--startup",
+        nargs="*",
+        default=None,
+        metavar="MODULE",
+        help="measure cold import cost per module instead of running benchmarks (default: all generator modules)",
+    )
+    args = parser.parse_args()
+
+    if args.startup is not None:
+        results = run_startup(args.startup or STARTUP_MODULES)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "startup": results,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"Results written to {args.output}")
+        return 1 if any(result["error"] for result in results) else 0
+
+    names = args.only or [*BENCHMARKS, *SIZE_INDEPENDENT_BENCHMARKS]
+    cases = []
+    for name in names:
+        if name in SIZE_INDEPENDENT_BENCHMARKS:
+            cases.append((name, None))
+        else:
+            cases.extend((name, size) for size in args.sizes)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name, size in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(
+                run_case, name, size, args.latex_density, args.repeat, args.seed, args.odt
+            ).result()
+        results.append(result)
+        if result["error"]:
+            print(f"{name} size={size}: failed ({result['error']})")
+        else:
+            print(
+                f"{name} size={size}: {result['throughput_per_s']:.1f} items/s, "
+                f"p50 {result['p50_ms']:.2f}ms, p95 {result['p95_ms']:.2f}ms, peak RSS {result['peak_rss_mb']:.1f}MB"
+            )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "latex_density": args.latex_density,
+                "repeat": args.repeat,
+                "seed": args.seed,
+                "results": results,
+            },
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare_results(results, args.compare, args.threshold)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,28 @@
+import bisect
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import Executor
+import copy
 from enum import StrEnum
+import io
 import json
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Collection, Iterable, Iterator, TextIO
+import weakref
 from docx import Document
 from docx.document import Document as DocumentObject
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.part import Part
 from docx.text.paragraph import Paragraph
+from docx.text.run import Run
 from docx.oxml.shared import OxmlElement
 from docx.oxml.ns import qn
-from pydantic import BaseModel, Field
-from latex2word import LatexToWordElement
+from pydantic import BaseModel, Field, ValidationError
+
+from test_docx_equation import LatexConversionError, SegmentKind, iter_latex_segments, latex_cache, print_latex_failures
 
 
 quiz_type_index_mapping = {
@@ -48,6 +64,22 @@ quiz_category_mapping = {
 }
 
 
+PLACEHOLDER_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+ANSWERS_TITLE_TEXT = "答案卷"
+
+TEMPLATE_CACHE_MAX_SIZE = 8
+QUIZZES_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Parsed templates keyed by absolute path, with the (mtime, size) they were parsed at
+_template_cache: OrderedDict[str, tuple[tuple[int, int], DocumentObject]] = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+# Style name -> style id lookups per document part; resolving a style name scans styles.xml every time
+_style_id_cache: weakref.WeakKeyDictionary[Part, dict[tuple[str, WD_STYLE_TYPE], str | None]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
 class QuizType(StrEnum):
     MULTIPLE_CHOICE = "mcq"
     SHORT_ANSWER = "saq"
@@ -74,7 +106,7 @@ class Quiz(BaseModel):
     answer: int
 
 
-class Quizzes(BaseModel):
+class QuizzesInfo(BaseModel):
     academic_year: int
     level: str
     grade: str
@@ -82,41 +114,323 @@ class Quizzes(BaseModel):
     subject: str
     chapter: str
     title: str
+
+
+class Quizzes(QuizzesInfo):
     quizzes: list[Quiz]
 
 
-def replace_quizzes_info(quizzes: Quizzes, document: DocumentObject) -> str:
+def load_quizzes(quizzes_file: str) -> Quizzes:
+    # Parse and validate in one step in pydantic-core, without an intermediate json.loads dict
+    with open(quizzes_file, "rb") as f:
+        return Quizzes.model_validate_json(f.read())
+
+
+@dataclass(slots=True, frozen=True)
+class CompactQuiz:
+    # Same fields as Quiz without the per-instance __dict__ and pydantic bookkeeping
+    quiz_type: QuizType
+    quiz_category: QuizCategory
+    source: str
+    question: str
+    options: tuple[str, ...]
+    explanation: str
+    answer: int
+
+
+class CompactQuizBank:
+    """
+    Memory-lean, read-only store of quizzes for large question banks.
+
+    Quizzes are kept as `CompactQuiz` instances. Sources, option strings and whole option tuples are shared
+    between quizzes that repeat them, and the type/category are the enum singletons. A bank can be passed
+    anywhere an iterable of quizzes is accepted, e.g. `render_document(info, quiz_iter=bank)`.
+    """
+
+    def __init__(self, quizzes: Iterable[Quiz] = ()):
+        self.quizzes: list[CompactQuiz] = []
+        self._strings: dict[str, str] = {}
+        self._options: dict[tuple[str, ...], tuple[str, ...]] = {}
+        for quiz in quizzes:
+            self.add(quiz)
+
+    @classmethod
+    def from_file(cls, quizzes_file: str) -> "CompactQuizBank":
+        return cls(iter_quizzes(quizzes_file))
+
+    def _share(self, value: str) -> str:
+        return self._strings.setdefault(value, value)
+
+    def add(self, quiz: Quiz) -> CompactQuiz:
+        options = tuple(self._share(option) for option in quiz.options)
+        compact_quiz = CompactQuiz(
+            quiz_type=QuizType(quiz.quiz_type),
+            quiz_category=QuizCategory(quiz.quiz_category),
+            source=self._share(quiz.source),
+            question=quiz.question,
+            options=self._options.setdefault(options, options),
+            explanation=quiz.explanation,
+            answer=quiz.answer,
+        )
+        self.quizzes.append(compact_quiz)
+        return compact_quiz
+
+    def __iter__(self) -> Iterator[CompactQuiz]:
+        return iter(self.quizzes)
+
+    def __len__(self) -> int:
+        return len(self.quizzes)
+
+
+class QuizzesJsonScanner:
+    """
+    Incremental scanner over a `Quizzes` JSON document read in chunks.
+
+    Iterating yields each element of the top-level "quizzes" array, decoded, one at a time, so a large
+    question bank never has to be held in memory at once. The other top-level members are collected in
+    `members`. Values are located and decoded by the C JSON scanner; only the top-level punctuation between
+    them is handled here.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = QUIZZES_STREAM_CHUNK_SIZE):
+        self._f = f
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self.members: dict[str, Any] = {}
+
+    def _fill(self) -> bool:
+        chunk = self._f.read(self._chunk_size)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON input.")
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON input, got {char!r}.")
+        self._pos += 1
+        return char
+
+    def _read_value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # The value may just be cut off at the end of the buffer
+                if self._fill():
+                    continue
+                raise
+            # A number ending exactly at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Any]:
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self._read_value()
+            self._expect(":")
+            if key == "quizzes":
+                self._expect("[")
+                if self._peek() == "]":
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._read_value()
+                        if self._expect(",]") == "]":
+                            break
+            else:
+                self.members[key] = self._read_value()
+            if self._expect(",}") == "}":
+                return
+
+
+def iter_quizzes(quizzes_file: str, chunk_size: int = QUIZZES_STREAM_CHUNK_SIZE) -> Iterator[Quiz]:
+    # Validate quizzes one by one as they are read
+    with open(quizzes_file, "r", encoding="utf-8") as f:
+        for quiz_data in QuizzesJsonScanner(f, chunk_size):
+            yield Quiz.model_validate(quiz_data)
+
+
+def read_quizzes_info(quizzes_file: str, chunk_size: int = QUIZZES_STREAM_CHUNK_SIZE) -> QuizzesInfo:
+    # Everything but the quizzes, without keeping the quizzes array
+    with open(quizzes_file, "r", encoding="utf-8") as f:
+        scanner = QuizzesJsonScanner(f, chunk_size)
+        for _ in scanner:
+            pass
+    return QuizzesInfo.model_validate(scanner.members)
+
+
+def load_template(template_path: str) -> DocumentObject:
+    # Parse each template once per process and hand out deep copies, which skips unzipping and re-parsing
+    # every part. A template is re-parsed when its file changes, and the least recently used one is evicted.
+    key = os.path.abspath(template_path)
+    stat = os.stat(key)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _template_cache_lock:
+        cached = _template_cache.get(key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, Document(key))
+            _template_cache[key] = cached
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > TEMPLATE_CACHE_MAX_SIZE:
+            _template_cache.popitem(last=False)
+
+    return copy.deepcopy(cached[1])
+
+
+def clear_template_cache() -> None:
+    with _template_cache_lock:
+        _template_cache.clear()
+
+
+def iter_story_paragraphs(document: DocumentObject) -> Iterator[Paragraph]:
+    # Every paragraph in the body (including table cells and text boxes) and in the headers and footers.
+    # Walking the XML directly avoids building `row.cells`, which is slow on tables with merged cells.
+    stories = [document._body]
+    for section in document.sections:
+        for story in (
+            section.header,
+            section.first_page_header,
+            section.even_page_header,
+            section.footer,
+            section.first_page_footer,
+            section.even_page_footer,
+        ):
+            # A linked header/footer has no part of its own, and touching it would add one
+            if not story.is_linked_to_previous:
+                stories.append(story)
+
+    seen_elements = set()
+    for story in stories:
+        if story._element in seen_elements:
+            continue
+        seen_elements.add(story._element)
+        for p in story._element.iter(qn("w:p")):
+            yield Paragraph(p, story)
+
+
+def replace_placeholders_in_paragraph(paragraph: Paragraph, replace: Callable[[re.Match], str]) -> bool:
+    # Substitute across <w:t> boundaries while keeping the runs: each replacement goes into the text node
+    # where the placeholder starts, and the rest of the placeholder is cut from the following nodes.
+    text_nodes = paragraph._p.xpath("./w:r/w:t | ./w:hyperlink/w:r/w:t")
+    texts = [node.text or "" for node in text_nodes]
+    full_text = "".join(texts)
+    if "{{" not in full_text:
+        return False
+
+    node_starts = []
+    offset = 0
+    for text in texts:
+        node_starts.append(offset)
+        offset += len(text)
+
+    matches = list(PLACEHOLDER_PATTERN.finditer(full_text))
+    modified = False
+    for match in reversed(matches):
+        replacement = replace(match)
+        if replacement == match.group(0):
+            continue
+        modified = True
+        first_node = bisect.bisect_right(node_starts, match.start()) - 1
+        for i in range(first_node, len(text_nodes)):
+            node_start = node_starts[i]
+            if node_start >= match.end():
+                break
+            start = max(match.start() - node_start, 0)
+            end = min(match.end() - node_start, len(texts[i]))
+            texts[i] = texts[i][:start] + (replacement if i == first_node else "") + texts[i][end:]
+            text_nodes[i].text = texts[i]
+            text_nodes[i].set(qn("xml:space"), "preserve")
+    return modified
+
+
+def replace_quizzes_info(quizzes: QuizzesInfo, document: DocumentObject) -> None:
     keywords = {
-        "{{year}}": str(quizzes.academic_year),
-        "{{level}}": level_mapping.get(quizzes.level, quizzes.level),
-        "{{grade}}": quizzes.grade,
-        "{{semester}}": quizzes.semester,
-        "{{subject}}": quizzes.subject,
-        "{{chapter}}": quizzes.chapter,
-        "{{title}}": quizzes.title,
+        "year": str(quizzes.academic_year),
+        "level": level_mapping.get(quizzes.level, quizzes.level),
+        "grade": quizzes.grade,
+        "semester": quizzes.semester,
+        "subject": quizzes.subject,
+        "chapter": quizzes.chapter,
+        "title": quizzes.title,
     }
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    text_items = paragraph.text.split(" ")
 
-                    paragraph.text = ""
-                    for text_item in text_items:
-                        for keyword, value in keywords.items():
-                            text_item = text_item.replace(keyword, value)
+    def replace(match: re.Match) -> str:
+        return keywords.get(match.group(1), match.group(0))
+
+    for paragraph in iter_story_paragraphs(document):
+        if not replace_placeholders_in_paragraph(paragraph, replace):
+            continue
+        runs = paragraph.runs
+        answers_title_start = "".join(run.text for run in runs).find(ANSWERS_TITLE_TEXT)
+        if answers_title_start < 0:
+            continue
+        answers_title_end = answers_title_start + len(ANSWERS_TITLE_TEXT)
+        run_start = 0
+        for run in runs:
+            run_end = run_start + len(run.text)
+            if run_start < answers_title_end and run_end > answers_title_start:
+                run.style = "Title_answers"
+            run_start = run_end
+
+
+def get_style_id(paragraph: Paragraph, style: str, style_type: WD_STYLE_TYPE) -> str | None:
+    part = paragraph.part
+    style_ids = _style_id_cache.get(part)
+    if style_ids is None:
+        style_ids = _style_id_cache[part] = {}
+    key = (style, style_type)
+    if key not in style_ids:
+        style_ids[key] = part.get_style_id(style, style_type)
+    return style_ids[key]
+
+
+def set_paragraph_style(paragraph: Paragraph, style: str) -> None:
+    paragraph._p.style = get_style_id(paragraph, style, WD_STYLE_TYPE.PARAGRAPH)
+
 
-                        paragraph.add_run(text_item + " ", style="Title_answers" if "答案卷" in text_item else None)
+def append_run(paragraph: Paragraph, text: str = "", style: str | None = None) -> Run:
+    # Same result as `paragraph.add_run`, but builds the <w:r> directly and uses the cached style id
+    r = OxmlElement("w:r")
+    if style is not None:
+        r.style = get_style_id(paragraph, style, WD_STYLE_TYPE.CHARACTER)
+    if text:
+        r.text = text
+    paragraph._p.append(r)
+    return Run(r, paragraph)
 
 
 def add_text_with_latex(text: str, paragraph: Paragraph):
-    text_parts = text.split("$")
-    for part in text_parts:
-        if part.startswith("\\frac"):
-            latex_to_word = LatexToWordElement(part)
-            latex_to_word.add_latex_to_paragraph(paragraph)
-        else:
-            paragraph.add_run(part)
+    for segment in iter_latex_segments(text):
+        if segment.kind == SegmentKind.TEXT:
+            append_run(paragraph, segment.value)
+            continue
+        try:
+            paragraph._element.append(latex_cache.get(segment.value))
+        except LatexConversionError:
+            # Keep the source visible rather than dropping a formula latex2word cannot convert;
+            # failures are reported once through latex_cache.failures()
+            append_run(paragraph, segment.value)
 
 
 def insert_horizontal_line(paragraph: Paragraph) -> None:
@@ -134,101 +448,284 @@ def insert_horizontal_line(paragraph: Paragraph) -> None:
 
 
 def add_next_paragraph(paragraph: Paragraph, text: str = "", style: str | None = None) -> Paragraph:
-    document: DocumentObject = paragraph._parent
-    next_paragraph: Paragraph = document.add_paragraph(text=text, style=style)
-    paragraph._p.addnext(next_paragraph._element)
+    # Create the <w:p> right after `paragraph` instead of appending it to the body and moving it
+    p = OxmlElement("w:p")
+    paragraph._p.addnext(p)
+    next_paragraph = Paragraph(p, paragraph._parent)
+    if style is not None:
+        set_paragraph_style(next_paragraph, style)
+    if text:
+        append_run(next_paragraph, text)
     return next_paragraph
 
 
-def add_quizzes(
-    index: int, quiz_type: QuizType, quizzes: list[Quiz], paragraph: Paragraph, is_answers: bool = False
-) -> Paragraph:
-    paragraph.add_run(
-        f"{quiz_type_index_mapping.get(index, index)}、{quiz_type_mapping.get(quiz_type, quiz_type)} (每題 ___ 分。共 ____ 分)："
+class QuizIndex:
+    # Quizzes bucketed by type and by (type, category) in one pass, each bucket keeping the original order
+    def __init__(self, quizzes: Iterable[Quiz]):
+        self.by_type: dict[QuizType, list[Quiz]] = {quiz_type: [] for quiz_type in QuizType}
+        self.by_type_and_category: dict[tuple[QuizType, QuizCategory], list[Quiz]] = {}
+        for quiz in quizzes:
+            self.by_type[quiz.quiz_type].append(quiz)
+            self.by_type_and_category.setdefault((quiz.quiz_type, quiz.quiz_category), []).append(quiz)
+
+    def select(self, quiz_type: QuizType, categories: Collection[QuizCategory] | None = None) -> list[Quiz]:
+        if categories is None:
+            return self.by_type[quiz_type]
+        if len(categories) == 1:
+            return self.by_type_and_category.get((quiz_type, next(iter(categories))), [])
+        return [quiz for quiz in self.by_type[quiz_type] if quiz.quiz_category in categories]
+
+
+def add_quizzes_title(index: int, quiz_type: QuizType, paragraph: Paragraph) -> None:
+    append_run(
+        paragraph,
+        f"{quiz_type_index_mapping.get(index, index)}、{quiz_type_mapping.get(quiz_type, quiz_type)} (每題 ___ 分。共 ____ 分)：",
     )
-    paragraph.style = "quizzes_title"
+    set_paragraph_style(paragraph, "quizzes_title")
+
+
+def add_quiz(quiz_index: int, quiz: Quiz, paragraph: Paragraph, is_answers: bool = False) -> Paragraph:
+    if quiz.quiz_type == QuizType.MULTIPLE_CHOICE:
+        answer_text = option_index_mapping.get(quiz.answer + 1, quiz.answer + 1) if is_answers else "  "
+        paragraph = add_next_paragraph(paragraph, text="（", style="quiz_question_mcq")
+        append_run(paragraph, text=answer_text, style="quiz_option_answer")
+        append_run(paragraph, text=f"）{quiz_index+1}. ")
+        add_text_with_latex(quiz.question, paragraph)
+        for i, option in enumerate(quiz.options):
+            paragraph = add_next_paragraph(paragraph, style="quiz_option")
+            append_run(paragraph, text=f"（{option_index_mapping.get(i + 1, i + 1)}）")
+            add_text_with_latex(option, paragraph)
+        if is_answers:
+            paragraph = add_next_paragraph(paragraph, style="quiz_explanation_mcq")
+            append_run(paragraph, text="詳解：\r", style="quiz_explanation_title_mcq")
+            add_text_with_latex(quiz.explanation, paragraph)
+    elif quiz.quiz_type == QuizType.SHORT_ANSWER:
+        paragraph = add_next_paragraph(
+            paragraph,
+            text=f"{quiz_index+1}. ",
+            style="quiz_question_saq",
+        )
+        add_text_with_latex(quiz.question, paragraph)
+        if not is_answers:
+            paragraph = add_next_paragraph(paragraph)
+            insert_horizontal_line(paragraph)
+            paragraph = add_next_paragraph(paragraph, style="horizontal_line")
+            paragraph = add_next_paragraph(paragraph)
+            insert_horizontal_line(paragraph)
+            paragraph = add_next_paragraph(paragraph)
+        else:
+            paragraph = add_next_paragraph(paragraph, style="quiz_explanation")
+            append_run(paragraph, text="參考答案：\r", style="quiz_explanation_title")
+            add_text_with_latex(quiz.explanation, paragraph)
+            insert_horizontal_line(paragraph)
+    return paragraph
 
-    quiz_index = 0
-    for quiz in quizzes:
-        if quiz.quiz_type != quiz_type:
-            continue
 
-        if quiz_type == QuizType.MULTIPLE_CHOICE:
-            answer_text = option_index_mapping.get(quiz.answer + 1, quiz.answer + 1) if is_answers else "  "
-            paragraph = add_next_paragraph(paragraph, text="（", style="quiz_question_mcq")
-            paragraph.add_run(text=answer_text, style="quiz_option_answer")
-            paragraph.add_run(text=f"）{quiz_index+1}. ")
-            add_text_with_latex(quiz.question, paragraph)
-            for i, option in enumerate(quiz.options):
-                paragraph = add_next_paragraph(paragraph, style="quiz_option")
-                paragraph.add_run(text=f"（{option_index_mapping.get(i + 1, i + 1)}）")
-                add_text_with_latex(option, paragraph)
+def add_quiz_sections(
+    quiz_index: QuizIndex,
+    quizzes_paragraph: Paragraph | None,
+    answers_paragraph: Paragraph | None,
+    categories: Collection[QuizCategory] | None = None,
+) -> None:
+    # Emit the question paper and the answer key together, in one traversal of each quiz type's bucket.
+    # (section index on the paper, section index on the answer key, quiz type)
+    sections = [
+        (1, 1, QuizType.MULTIPLE_CHOICE),
+        (1, 2, QuizType.SHORT_ANSWER),
+    ]
+    for section_number, (paper_index, answers_index, quiz_type) in enumerate(sections):
+        if section_number > 0:
+            if quizzes_paragraph is not None:
+                quizzes_paragraph = add_next_paragraph(quizzes_paragraph)
+            if answers_paragraph is not None:
+                answers_paragraph = add_next_paragraph(answers_paragraph)
+        if quizzes_paragraph is not None:
+            add_quizzes_title(paper_index, quiz_type, quizzes_paragraph)
+        if answers_paragraph is not None:
+            add_quizzes_title(answers_index, quiz_type, answers_paragraph)
+
+        for i, quiz in enumerate(quiz_index.select(quiz_type, categories)):
+            if quizzes_paragraph is not None:
+                quizzes_paragraph = add_quiz(i, quiz, quizzes_paragraph)
+            if answers_paragraph is not None:
+                answers_paragraph = add_quiz(i, quiz, answers_paragraph, is_answers=True)
+
+
+def render_document(
+    quizzes: QuizzesInfo,
+    template_path: str = "template.docx",
+    categories: Collection[QuizCategory] | None = None,
+    quiz_iter: Iterable[Quiz] | None = None,
+) -> DocumentObject:
+    # `quiz_iter` (e.g. from iter_quizzes) replaces `quizzes.quizzes`, so `quizzes` can be a QuizzesInfo
+    document = load_template(template_path)
+
+    replace_quizzes_info(quizzes, document)
+
+    quizzes_paragraph = None
+    answers_paragraph = None
+    for paragraph in document.paragraphs:
+        if "{{quizzes}}" in paragraph.text:
+            paragraph.text = ""
+            quizzes_paragraph = paragraph
+        elif "{{answers}}" in paragraph.text:
+            paragraph.text = ""
+            answers_paragraph = paragraph
+
+    quiz_index = QuizIndex(quizzes.quizzes if quiz_iter is None else quiz_iter)
+    add_quiz_sections(quiz_index, quizzes_paragraph, answers_paragraph, categories)
+
+    return document
+
+
+def find_answers_section(document: DocumentObject) -> tuple[int, int] | None:
+    # Split the body blocks into the question paper and the answer key: the answer key starts after the last
+    # page break before {{answers}}, or right after the {{quizzes}} block when there is no page break.
+    # Returns (end of the paper blocks, start of the answer key blocks), or None without an {{answers}} block.
+    blocks = [block for block in document.element.body if block.tag != qn("w:sectPr")]
+    quizzes_index = None
+    for answers_index, block in enumerate(blocks):
+        block_text = "".join(block.itertext())
+        if "{{quizzes}}" in block_text:
+            quizzes_index = answers_index
+        elif "{{answers}}" in block_text:
+            break
+    else:
+        return None
+
+    for i in range(answers_index - 1, -1 if quizzes_index is None else quizzes_index, -1):
+        if blocks[i].xpath(".//w:br[@w:type='page']"):
+            return i, i + 1
+    split_index = answers_index if quizzes_index is None else quizzes_index + 1
+    return split_index, split_index
+
+
+def keep_document_section(document: DocumentObject, is_answers: bool) -> None:
+    section = find_answers_section(document)
+    if section is None:
+        return
+    paper_end, answers_start = section
+    blocks = [block for block in document.element.body if block.tag != qn("w:sectPr")]
+    for block in blocks[:answers_start] if is_answers else blocks[paper_end:]:
+        block.getparent().remove(block)
+
+
+def render_paper_document(
+    quizzes: QuizzesInfo,
+    template_path: str = "template.docx",
+    is_answers: bool = False,
+    categories: Collection[QuizCategory] | None = None,
+    quiz_iter: Iterable[Quiz] | None = None,
+) -> DocumentObject:
+    # Only the question paper, or only the answer key, of the template
+    document = load_template(template_path)
+    keep_document_section(document, is_answers)
+
+    replace_quizzes_info(quizzes, document)
+
+    placeholder = "{{answers}}" if is_answers else "{{quizzes}}"
+    for paragraph in document.paragraphs:
+        if placeholder in paragraph.text:
+            paragraph.text = ""
+            quiz_index = QuizIndex(quizzes.quizzes if quiz_iter is None else quiz_iter)
             if is_answers:
-                paragraph = add_next_paragraph(paragraph, style="quiz_explanation_mcq")
-                paragraph.add_run(text="詳解：\r", style="quiz_explanation_title_mcq")
-                add_text_with_latex(quiz.explanation, paragraph)
-        elif quiz_type == QuizType.SHORT_ANSWER:
-            paragraph = add_next_paragraph(
-                paragraph,
-                text=f"{quiz_index+1}. ",
-                style="quiz_question_saq",
-            )
-            add_text_with_latex(quiz.question, paragraph)
-            if not is_answers:
-                paragraph = add_next_paragraph(paragraph)
-                insert_horizontal_line(paragraph)
-                paragraph = add_next_paragraph(paragraph, style="horizontal_line")
-                paragraph = add_next_paragraph(paragraph)
-                insert_horizontal_line(paragraph)
-                paragraph = add_next_paragraph(paragraph)
+                add_quiz_sections(quiz_index, None, paragraph, categories)
             else:
-                paragraph = add_next_paragraph(paragraph, style="quiz_explanation")
-                paragraph.add_run(text="參考答案：\r", style="quiz_explanation_title")
-                add_text_with_latex(quiz.explanation, paragraph)
-                insert_horizontal_line(paragraph)
-
-        quiz_index += 1
-    return paragraph
+                add_quiz_sections(quiz_index, paragraph, None, categories)
+            break
+
+    return document
+
+
+def render_paper_document_bytes(
+    quizzes: Quizzes,
+    template_path: str = "template.docx",
+    is_answers: bool = False,
+    categories: Collection[QuizCategory] | None = None,
+) -> bytes:
+    # Documents cannot leave a process; a worker returns the saved .docx instead
+    buffer = io.BytesIO()
+    render_paper_document(quizzes, template_path, is_answers, categories).save(buffer)
+    latex_cache.save()
+    return buffer.getvalue()
+
+
+def render_paper_documents(
+    quizzes: Quizzes,
+    template_path: str = "template.docx",
+    categories: Collection[QuizCategory] | None = None,
+    executor: Executor | None = None,
+) -> tuple[DocumentObject, DocumentObject]:
+    # Render the student paper and the answer key in parallel, by default on two processes, and return
+    # (paper, answers). python-docx work holds the GIL, so each document needs its own process.
+    from concurrent.futures import ProcessPoolExecutor
+
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(max_workers=2)
+    try:
+        paper_future = executor.submit(render_paper_document_bytes, quizzes, template_path, False, categories)
+        answers_future = executor.submit(render_paper_document_bytes, quizzes, template_path, True, categories)
+        return Document(io.BytesIO(paper_future.result())), Document(io.BytesIO(answers_future.result()))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def save_paper_document(
+    quizzes: Quizzes,
+    output_path: str,
+    template_path: str = "template.docx",
+    is_answers: bool = False,
+    categories: Collection[QuizCategory] | None = None,
+) -> float:
+    start = time.perf_counter()
+    render_paper_document(quizzes, template_path, is_answers, categories).save(output_path)
+    latex_cache.save()
+    return time.perf_counter() - start
+
+
+def save_paper_documents(
+    quizzes: Quizzes,
+    paper_path: str,
+    answers_path: str,
+    template_path: str = "template.docx",
+    categories: Collection[QuizCategory] | None = None,
+    executor: Executor | None = None,
+) -> tuple[float, float]:
+    # Render and save the student paper and the answer key in parallel, by default on two processes.
+    # Returns the time each document took.
+    from concurrent.futures import ProcessPoolExecutor
+
+    own_executor = executor is None
+    executor = executor or ProcessPoolExecutor(max_workers=2)
+    try:
+        paper_future = executor.submit(save_paper_document, quizzes, paper_path, template_path, False, categories)
+        answers_future = executor.submit(save_paper_document, quizzes, answers_path, template_path, True, categories)
+        return paper_future.result(), answers_future.result()
+    finally:
+        if own_executor:
+            executor.shutdown()
 
 
 def main():
     # load quizzes.json file
     quizzes_file = "quizzes.json"
     try:
-        with open(quizzes_file, "r", encoding="utf-8") as f:
-            quizzes_data = f.read()
+        quizzes = load_quizzes(quizzes_file)
     except FileNotFoundError:
         print(f"Error: The file {quizzes_file} does not exist.")
         return
+    except ValidationError as e:
+        print(f"Error creating Quiz objects from {quizzes_file}: {e}")
+        return
     except Exception as e:
         print(f"Error reading {quizzes_file}: {e}")
         return
-    try:
-        quizzes = Quizzes(**json.loads(quizzes_data))
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON from {quizzes_file}: {e}")
-        return
-    except TypeError as e:
-        print(f"Error creating Quiz objects: {e}")
-        return
-
-    document = Document("template.docx")
-
-    replace_quizzes_info(quizzes, document)
-
-    for paragraph in document.paragraphs:
-        if "{{quizzes}}" in paragraph.text:
-            paragraph.text = ""
-            paragraph = add_quizzes(1, QuizType.MULTIPLE_CHOICE, quizzes.quizzes, paragraph)
-            paragraph = add_next_paragraph(paragraph)
-            paragraph = add_quizzes(1, QuizType.SHORT_ANSWER, quizzes.quizzes, paragraph)
-        elif "{{answers}}" in paragraph.text:
-            paragraph.text = ""
-            paragraph = add_quizzes(1, QuizType.MULTIPLE_CHOICE, quizzes.quizzes, paragraph, is_answers=True)
-            paragraph = add_next_paragraph(paragraph)
-            paragraph = add_quizzes(2, QuizType.SHORT_ANSWER, quizzes.quizzes, paragraph, is_answers=True)
 
+    document = render_document(quizzes, "template.docx")
     document.save("demo.docx")
+    latex_cache.save()
+    print_latex_failures()
 
 
 if __name__ == "__main__":
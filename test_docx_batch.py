@@ -0,0 +1,151 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing.util import Finalize
+import os
+import sys
+import time
+from typing import Iterator
+
+from pydantic import BaseModel
+
+from test_docx import Quizzes, render_document
+from test_docx_equation import latex_cache
+
+
+class BatchJob(BaseModel):
+    name: str
+    payload: str
+    output_path: str
+
+
+class BatchResult(BaseModel):
+    name: str
+    output_path: str
+    elapsed: float
+    error: str | None = None
+
+
+def iter_batch_jobs(source: str, output_dir: str) -> Iterator[BatchJob]:
+    # A directory of *.json files, a JSONL file with one Quizzes payload per line, or "-" for JSONL on stdin
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(source, filename), "r", encoding="utf-8") as f:
+                payload = f.read()
+            name = filename[: filename.rfind(".")]
+            yield BatchJob(name=name, payload=payload, output_path=os.path.join(output_dir, f"{name}.docx"))
+        return
+
+    f = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for line_index, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            name = f"line-{line_index + 1:05d}"
+            yield BatchJob(name=name, payload=line, output_path=os.path.join(output_dir, f"{name}.docx"))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def init_batch_worker(latex_cache_file: str | None) -> None:
+    latex_cache.set_cache_file(latex_cache_file)
+    # Merge this worker's conversions into the cache file once, when the pool shuts the worker down,
+    # instead of re-reading and rewriting the whole file after every job
+    Finalize(latex_cache, latex_cache.save, exitpriority=10)
+
+
+def render_batch_job(job: BatchJob, template_path: str) -> BatchResult:
+    start = time.perf_counter()
+    try:
+        quizzes = Quizzes.model_validate_json(job.payload)
+        document = render_document(quizzes, template_path)
+        document.save(job.output_path)
+    except Exception as e:
+        return BatchResult(
+            name=job.name,
+            output_path=job.output_path,
+            elapsed=time.perf_counter() - start,
+            error=f"{type(e).__name__}: {e}",
+        )
+    return BatchResult(name=job.name, output_path=job.output_path, elapsed=time.perf_counter() - start)
+
+
+def run_batch(
+    jobs: Iterator[BatchJob],
+    report_path: str,
+    template_path: str = "template.docx",
+    max_workers: int | None = None,
+    latex_cache_file: str | None = None,
+) -> list[BatchResult]:
+    max_workers = max_workers or os.cpu_count() or 1
+    # Keep a bounded number of jobs in flight so large JSONL streams are never fully loaded
+    max_pending = max_workers * 4
+
+    results: list[BatchResult] = []
+    with open(report_path, "w", encoding="utf-8") as report, ProcessPoolExecutor(
+        max_workers=max_workers, initializer=init_batch_worker, initargs=(latex_cache_file,)
+    ) as executor:
+        pending: set[Future] = set()
+
+        def collect(done: set[Future]):
+            for future in done:
+                result: BatchResult = future.result()
+                results.append(result)
+                # Write results incrementally so an interrupted run still leaves a usable report
+                report.write(result.model_dump_json() + "\n")
+                report.flush()
+                status = "ok" if result.error is None else f"failed ({result.error})"
+                print(f"[{len(results)}] {result.name}: {status} in {result.elapsed:.3f}s")
+
+        for job in jobs:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(render_batch_job, job, template_path))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render many quiz papers from Quizzes payloads.")
+    parser.add_argument("source", help="directory of .json files, a .jsonl file, or '-' for JSONL on stdin")
+    parser.add_argument("-o", "--output-dir", default="output", help="directory for the generated .docx files")
+    parser.add_argument("-t", "--template", default="template.docx", help="template .docx file")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--latex-cache", default=None, help="JSON file persisting converted LaTeX across runs")
+    parser.add_argument("-r", "--report", default=None, help="JSONL report path (default: <output-dir>/report.jsonl)")
+    args = parser.parse_args()
+
+    if args.source != "-" and not os.path.exists(args.source):
+        print(f"Error: The source {args.source} does not exist.")
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    report_path = args.report or os.path.join(args.output_dir, "report.jsonl")
+
+    start = time.perf_counter()
+    results = run_batch(
+        iter_batch_jobs(args.source, args.output_dir),
+        report_path,
+        template_path=args.template,
+        max_workers=args.workers,
+        latex_cache_file=args.latex_cache,
+    )
+    elapsed = time.perf_counter() - start
+
+    failed = [result for result in results if result.error is not None]
+    throughput = len(results) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Rendered {len(results) - len(failed)}/{len(results)} documents in {elapsed:.2f}s "
+        f"({throughput:.1f} docs/s), report: {report_path}"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,310 @@
+from collections import OrderedDict
+import copy
+from enum import StrEnum
+import json
+import multiprocessing
+import os
 import re
 import sys
+import threading
+import time
+from typing import Iterator, NamedTuple
 
 from docx import Document
 from docx.text.paragraph import Paragraph
-from latex2word import LatexToWordElement
+from lxml import etree
+
+LATEX_CACHE_MAX_SIZE = 1024
+# Seconds a single conversion may take before its worker is replaced; None converts in-process without a limit
+LATEX_CONVERSION_TIMEOUT = 5.0
+# The only characters that can start a delimiter; everything between them is copied as a single slice
+LATEX_SPECIAL_CHARS_PATTERN = re.compile(r"[\\$]")
+LATEX_BRACKET_CLOSINGS = {"(": "\\)", "[": "\\]"}
+
+
+class LatexConversionError(Exception):
+    def __init__(self, latex: str, error: str, elapsed: float):
+        super().__init__(f"{error} (LaTeX: {latex})")
+        self.latex = latex
+        self.error = error
+        self.elapsed = elapsed
+
+    def report(self) -> dict:
+        return {"latex": self.latex, "error": self.error, "elapsed": self.elapsed}
+
+
+def import_latex_converter() -> None:
+    import latex2word  # noqa: F401
+
+
+def convert_latex_to_omml(latex: str) -> str:
+    # Runs in the conversion worker; OMML travels back as a string
+    from latex2word import LatexToWordElement
+
+    return etree.tostring(LatexToWordElement(latex).element(), encoding="unicode")
+
+
+class LatexCache:
+    """
+    LRU cache of LaTeX -> OMML conversions keyed on the whitespace-normalized LaTeX string.
+
+    Cached elements are never handed out directly; every lookup returns a copy that can be appended to a
+    paragraph. When `cache_file` is set, converted OMML is also stored on disk so later runs skip conversion.
+
+    Conversions run in a worker process with a time budget (`conversion_timeout`). Formulas that fail or time out
+    are remembered, so later lookups raise the same LatexConversionError at once instead of converting again.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LATEX_CACHE_MAX_SIZE,
+        cache_file: str | None = None,
+        conversion_timeout: float | None = LATEX_CONVERSION_TIMEOUT,
+    ):
+        self.max_size = max_size
+        self.conversion_timeout = conversion_timeout
+        self.hits = 0
+        self.misses = 0
+        self._elements: OrderedDict[str, etree._Element] = OrderedDict()
+        self._failures: OrderedDict[str, LatexConversionError] = OrderedDict()
+        self._pool = None
+        # A forked child inherits the pool object but none of its worker or handler threads
+        self._pool_pid = None
+        self._lock = threading.Lock()
+        self.set_cache_file(cache_file)
+
+    @staticmethod
+    def normalize(latex: str) -> str:
+        return " ".join(latex.split())
+
+    @staticmethod
+    def _read_cache_file(cache_file: str) -> dict[str, str]:
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading LaTeX cache {cache_file}: {e}")
+            return {}
+
+    def set_cache_file(self, cache_file: str | None) -> None:
+        self.cache_file = cache_file
+        self._stored_omml = self._read_cache_file(cache_file) if cache_file else {}
+        self._dirty = False
+
+    def _convert(self, key: str) -> str:
+        if self.conversion_timeout is None:
+            return convert_latex_to_omml(key)
+        if self._pool_pid != os.getpid():
+            self._pool = None
+        if self._pool is None:
+            # latex2word (and latex2mathml) is slow to import; start and warm up the worker outside the time budget
+            self._pool = multiprocessing.Pool(1)
+            self._pool_pid = os.getpid()
+            self._pool.apply(import_latex_converter)
+        try:
+            return self._pool.apply_async(convert_latex_to_omml, (key,)).get(self.conversion_timeout)
+        except multiprocessing.TimeoutError:
+            # The worker may be stuck for good; replace it instead of waiting
+            self._pool.terminate()
+            self._pool = None
+            raise TimeoutError(f"conversion took longer than {self.conversion_timeout}s") from None
+
+    def get(self, latex: str) -> etree._Element:
+        key = self.normalize(latex)
+        with self._lock:
+            element = self._elements.get(key)
+            if element is not None:
+                self.hits += 1
+                self._elements.move_to_end(key)
+                return copy.deepcopy(element)
+
+            failure = self._failures.get(key)
+            if failure is not None:
+                self.hits += 1
+                raise failure
+
+            omml = self._stored_omml.get(key)
+            if omml is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                start = time.perf_counter()
+                try:
+                    omml = self._convert(key)
+                except Exception as e:
+                    # Timeouts included: the worker is warmed up outside the budget, so a timeout is the formula's own
+                    failure = LatexConversionError(key, f"{type(e).__name__}: {e}", time.perf_counter() - start)
+                    self._failures[key] = failure
+                    while len(self._failures) > self.max_size:
+                        self._failures.popitem(last=False)
+                    raise failure from e
+                if self.cache_file:
+                    self._stored_omml[key] = omml
+                    self._dirty = True
+            element = etree.fromstring(omml)
+
+            self._elements[key] = element
+            while len(self._elements) > self.max_size:
+                self._elements.popitem(last=False)
+            return copy.deepcopy(element)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self.cache_file or not self._dirty:
+                return
+            # Merge with entries written by other processes since we loaded, then replace the file atomically
+            stored_omml = self._read_cache_file(self.cache_file)
+            stored_omml.update(self._stored_omml)
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(stored_omml, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+            self._stored_omml = stored_omml
+            self._dirty = False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._elements.clear()
+            self._failures.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.terminate()
+            self._pool = None
+
+    def failures(self) -> list[dict]:
+        # Structured reports of the formulas that could not be converted, oldest first
+        with self._lock:
+            return [failure.report() for failure in self._failures.values()]
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._elements), "failures": len(self._failures)}
+
+
+latex_cache = LatexCache()
+
+
+def print_latex_failures(cache: LatexCache = latex_cache) -> None:
+    for failure in cache.failures():
+        print(f"Error processing LaTeX: {failure['latex']}: {failure['error']} ({failure['elapsed']:.3f}s)")
 
 
 def add_latex_to_paragraph(latex: str, paragraph: Paragraph):
     try:
-        latex_element = LatexToWordElement(latex)
-        latex_element.add_latex_to_paragraph(paragraph)
-    except Exception as e:
-        print(f"Error processing LaTeX: {e}")
+        paragraph._element.append(latex_cache.get(latex))
+    except LatexConversionError:
+        # Reported once through latex_cache.failures(); known-bad formulas fall back without converting again
         paragraph.add_run(latex)
 
 
+class SegmentKind(StrEnum):
+    TEXT = "text"
+    INLINE = "inline"
+    DISPLAY = "display"
+
+
+class LatexSegment(NamedTuple):
+    kind: SegmentKind
+    value: str
+
+
+def find_closing_delimiter(text: str, delimiter: str, start: int, stop_at_newline: bool = False) -> int:
+    # Index of the next `delimiter` not escaped by a backslash, or -1
+    while True:
+        index = text.find(delimiter, start)
+        if index == -1 or (stop_at_newline and text.find("\n", start, index) != -1):
+            return -1
+        if index == 0 or text[index - 1] != "\\":
+            return index
+        start = index + 1
+
+
+def iter_latex_segments(text: str) -> Iterator[LatexSegment]:
+    """
+    Split text into plain text and LaTeX segments in a single left-to-right pass.
+
+    Recognizes $$...$$ and \\[...\\] as display math, $...$ (on one line) and \\(...\\) as inline math, and \\$ as
+    a literal dollar in text. Unclosed delimiters are kept as text. Segments are yielded as soon as they end.
+    """
+    text_parts = []
+    position = 0
+    length = len(text)
+    # Delimiters with no closing occurrence left; remembering them keeps the scan linear
+    unclosed = set()
+
+    def find_closing(delimiter: str, start: int, stop_at_newline: bool = False) -> int:
+        if delimiter in unclosed:
+            return -1
+        end = find_closing_delimiter(text, delimiter, start, stop_at_newline)
+        if end == -1 and not stop_at_newline:
+            unclosed.add(delimiter)
+        return end
+
+    def flush_text():
+        if text_parts:
+            value = "".join(text_parts)
+            text_parts.clear()
+            if value:
+                return LatexSegment(SegmentKind.TEXT, value)
+        return None
+
+    while position < length:
+        match = LATEX_SPECIAL_CHARS_PATTERN.search(text, position)
+        if match is None:
+            text_parts.append(text[position:])
+            break
+        index = match.start()
+        text_parts.append(text[position:index])
+        next_char = text[index + 1] if index + 1 < length else ""
+
+        if text[index] == "\\":
+            closing = LATEX_BRACKET_CLOSINGS.get(next_char)
+            end = find_closing(closing, index + 2) if closing else -1
+            if end == -1:
+                # "\\$" is a literal dollar; any other backslash pair is kept as is
+                text_parts.append("$" if next_char == "$" else text[index : index + 2])
+                position = index + 2
+                continue
+            kind = SegmentKind.INLINE if next_char == "(" else SegmentKind.DISPLAY
+            value_start, position = index + 2, end + 2
+        elif next_char == "$":
+            end = find_closing("$$", index + 2)
+            if end == -1:
+                text_parts.append("$$")
+                position = index + 2
+                continue
+            kind = SegmentKind.DISPLAY
+            value_start, position = index + 2, end + 2
+        else:
+            end = find_closing("$", index + 1, stop_at_newline=True)
+            if end == -1 or end == index + 1:
+                text_parts.append("$")
+                position = index + 1
+                continue
+            kind = SegmentKind.INLINE
+            value_start, position = index + 1, end + 1
+
+        segment = flush_text()
+        if segment is not None:
+            yield segment
+        yield LatexSegment(kind, text[value_start:end])
+
+    segment = flush_text()
+    if segment is not None:
+        yield segment
+
+
 def add_text_with_latex(text: str, paragraph: Paragraph):
-    regex_latex = r"\$\$(.*?)\$\$|(?<!\\)\$([^\$\n]+?)(?<!\\)\$"
-    matches = re.finditer(regex_latex, text, re.DOTALL)
-    last_end = 0
-    for match in matches:
-        # Add normal text before the LaTeX
-        paragraph.add_run(text[last_end : match.start()])
-        # Add LaTeX content
-        latex_content = match.group(1) or match.group(2)
-        add_latex_to_paragraph(latex_content, paragraph)
-        # Update last_end to the end of the current match
-        last_end = match.end()
-    # Add any remaining text after the last LaTeX
-    paragraph.add_run(text[last_end:])
+    for segment in iter_latex_segments(text):
+        if segment.kind == SegmentKind.TEXT:
+            paragraph.add_run(segment.value)
+        else:
+            add_latex_to_paragraph(segment.value, paragraph)
 
 
 def main():
@@ -57,6 +333,8 @@ def main():
         return 1
 
     document.save("test_docx_equation.docx")
+    latex_cache.save()
+    print_latex_failures()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,296 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import astuple, dataclass
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Iterable, Iterator
+import zipfile
+
+from lxml import etree
+
+from test_odt import FormulaRecord, iter_odt_records, release
+
+WORD_NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+MATH_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+W_P = f"{{{WORD_NAMESPACE}}}p"
+W_PSTYLE = f"{{{WORD_NAMESPACE}}}pStyle"
+W_VAL = f"{{{WORD_NAMESPACE}}}val"
+M_OMATH = f"{{{MATH_NAMESPACE}}}oMath"
+M_T = f"{{{MATH_NAMESPACE}}}t"
+# Run formatting only; leaving it out of the normalized form lets the same formula hash the same in any font or style
+OMML_FORMATTING_TAGS = {f"{{{WORD_NAMESPACE}}}rPr", f"{{{MATH_NAMESPACE}}}rPr", f"{{{MATH_NAMESPACE}}}ctrlPr"}
+
+FORMULA_INDEX_FILE = "formula_index.sqlite"
+SUPPORTED_EXTENSIONS = (".odt", ".docx")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS formulas (
+    hash TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    formula TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS occurrences (
+    hash TEXT NOT NULL REFERENCES formulas (hash),
+    path TEXT NOT NULL REFERENCES files (path),
+    paragraph_index INTEGER,
+    style_name TEXT
+);
+CREATE INDEX IF NOT EXISTS occurrences_hash ON occurrences (hash);
+CREATE INDEX IF NOT EXISTS occurrences_path ON occurrences (path);
+"""
+
+
+@dataclass(slots=True)
+class FormulaOccurrence:
+    hash: str
+    # "starmath" for ODT annotations, "omml" for Word equations
+    kind: str
+    # Human-readable form: the StarMath source, or the text of the OMML runs
+    formula: str
+    paragraph_index: int | None
+    style_name: str | None
+
+
+def formula_hash(kind: str, normalized: str) -> str:
+    return hashlib.sha256(f"{kind}\0{normalized}".encode("utf-8")).hexdigest()[:32]
+
+
+def normalize_omml(element) -> str:
+    # Structural form of an equation: element names, semantic attributes and text, without run formatting
+    if element.tag in OMML_FORMATTING_TAGS:
+        return ""
+    name = etree.QName(element).localname
+    attributes = ",".join(f"{etree.QName(key).localname}={value}" for key, value in sorted(element.attrib.items()))
+    children = "".join(normalize_omml(child) for child in element if isinstance(child.tag, str))
+    text = (element.text or "").strip() if element.tag == M_T else ""
+    return f"{name}[{attributes}]({text}{children})"
+
+
+def iter_odt_formulas(file_path: str) -> Iterator[FormulaOccurrence]:
+    # Formula records arrive before the paragraph that holds them; attach the paragraph style once it is known
+    pending: list[FormulaRecord] = []
+    for record in iter_odt_records(file_path):
+        if isinstance(record, FormulaRecord):
+            if record.paragraph_index is None:
+                yield from odt_occurrences([record], None)
+            else:
+                pending.append(record)
+            continue
+        yield from odt_occurrences([formula for formula in pending if formula.paragraph_index == record.index], record.style_name)
+        pending = [formula for formula in pending if formula.paragraph_index != record.index]
+    yield from odt_occurrences(pending, None)
+
+
+def odt_occurrences(records, style_name: str | None) -> Iterator[FormulaOccurrence]:
+    for record in records:
+        if not record.annotation:
+            # Without a StarMath annotation there is no source to index
+            continue
+        formula = " ".join(record.annotation.split())
+        yield FormulaOccurrence(formula_hash("starmath", formula), "starmath", formula, record.paragraph_index, style_name)
+
+
+def iter_docx_formulas(file_path: str) -> Iterator[FormulaOccurrence]:
+    # Stream word/document.xml; every top-level paragraph is released once its equations are indexed
+    with zipfile.ZipFile(file_path) as docx_zip, docx_zip.open("word/document.xml") as document:
+        paragraph_index = 0
+        for _, paragraph in etree.iterparse(document, tag=W_P):
+            # Paragraphs nested in another one (text boxes) are indexed as part of the outer paragraph
+            if any(ancestor.tag == W_P for ancestor in paragraph.iterancestors()):
+                continue
+            paragraph_index += 1
+            style = paragraph.find(f"./{{{WORD_NAMESPACE}}}pPr/{W_PSTYLE}")
+            style_name = style.get(W_VAL) if style is not None else None
+            for equation in paragraph.iter(M_OMATH):
+                # Nested oMath (e.g. inside oMathPara) is covered by its outermost equation
+                if any(ancestor.tag == M_OMATH for ancestor in equation.iterancestors()):
+                    continue
+                normalized = normalize_omml(equation)
+                formula = "".join(text.text or "" for text in equation.iter(M_T))
+                yield FormulaOccurrence(formula_hash("omml", normalized), "omml", formula, paragraph_index, style_name)
+            release(paragraph)
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_file(file_path: str, known_sha256: str | None) -> dict:
+    # Runs in a worker process. Hashing happens here too, so only files whose contents changed are parsed.
+    result = {"path": file_path, "sha256": None, "changed": False, "occurrences": [], "error": None}
+    try:
+        stat = os.stat(file_path)
+        result["mtime_ns"], result["size"] = stat.st_mtime_ns, stat.st_size
+        result["sha256"] = file_sha256(file_path)
+        if result["sha256"] == known_sha256:
+            return result
+        result["changed"] = True
+        extract = iter_odt_formulas if file_path.lower().endswith(".odt") else iter_docx_formulas
+        result["occurrences"] = [astuple(occurrence) for occurrence in extract(file_path)]
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def iter_formula_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.path.abspath(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                # Skip Office lock files such as "~$paper.docx"
+                if filename.lower().endswith(SUPPORTED_EXTENSIONS) and not filename.startswith("~$"):
+                    yield os.path.abspath(os.path.join(dirpath, filename))
+
+
+def open_index(index_file: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(index_file)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def store_scan_result(connection: sqlite3.Connection, result: dict) -> None:
+    with connection:
+        if result["changed"]:
+            connection.execute("DELETE FROM occurrences WHERE path = ?", (result["path"],))
+            connection.executemany(
+                "INSERT OR IGNORE INTO formulas (hash, kind, formula) VALUES (?, ?, ?)",
+                {occurrence[:3] for occurrence in result["occurrences"]},
+            )
+            connection.executemany(
+                "INSERT INTO occurrences (hash, path, paragraph_index, style_name) VALUES (?, ?, ?, ?)",
+                [(hash, result["path"], paragraph_index, style_name) for hash, _, _, paragraph_index, style_name in result["occurrences"]],
+            )
+        connection.execute(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, sha256, scanned_at) VALUES (?, ?, ?, ?, ?)",
+            (result["path"], result["mtime_ns"], result["size"], result["sha256"], time.time()),
+        )
+
+
+def prune_index(connection: sqlite3.Connection, roots: list[str], seen: set[str]) -> int:
+    # Forget files under the scanned roots that no longer exist, then formulas nothing refers to
+    removed = 0
+    with connection:
+        for (path,) in connection.execute("SELECT path FROM files").fetchall():
+            in_roots = any(path == root or path.startswith(root.rstrip(os.sep) + os.sep) for root in roots)
+            if in_roots and path not in seen:
+                connection.execute("DELETE FROM occurrences WHERE path = ?", (path,))
+                connection.execute("DELETE FROM files WHERE path = ?", (path,))
+                removed += 1
+        connection.execute("DELETE FROM formulas WHERE hash NOT IN (SELECT DISTINCT hash FROM occurrences)")
+    return removed
+
+
+def update_formula_index(paths: list[str], index_file: str = FORMULA_INDEX_FILE, max_workers: int | None = None) -> dict:
+    connection = open_index(index_file)
+    known = {
+        path: (mtime_ns, size, sha256)
+        for path, mtime_ns, size, sha256 in connection.execute("SELECT path, mtime_ns, size, sha256 FROM files")
+    }
+    stats = {"files": 0, "unchanged": 0, "rescanned": 0, "failed": 0}
+
+    seen = set()
+    to_scan = []
+    for file_path in iter_formula_files(paths):
+        seen.add(file_path)
+        stats["files"] += 1
+        stat = os.stat(file_path) if os.path.exists(file_path) else None
+        previous = known.get(file_path)
+        # Same mtime and size: trust it without reading the file
+        if stat is not None and previous is not None and previous[:2] == (stat.st_mtime_ns, stat.st_size):
+            stats["unchanged"] += 1
+            continue
+        to_scan.append((file_path, previous[2] if previous else None))
+
+    if to_scan:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(scan_file, file_path, known_sha256) for file_path, known_sha256 in to_scan]
+            for future in as_completed(futures):
+                result = future.result()
+                if result["error"]:
+                    stats["failed"] += 1
+                    print(f"{result['path']}: failed ({result['error']})")
+                    continue
+                store_scan_result(connection, result)
+                if result["changed"]:
+                    stats["rescanned"] += 1
+                else:
+                    # Touched but identical contents; only the stored mtime was refreshed
+                    stats["unchanged"] += 1
+
+    stats["pruned"] = prune_index(connection, [os.path.abspath(path) for path in paths], seen)
+    stats["formulas"] = connection.execute("SELECT COUNT(*) FROM formulas").fetchone()[0]
+    stats["occurrences"] = connection.execute("SELECT COUNT(*) FROM occurrences").fetchone()[0]
+    connection.close()
+    return stats
+
+
+def export_formula_index(index_file: str, jsonl_path: str) -> int:
+    # One line per distinct formula, with every place it was found
+    connection = open_index(index_file)
+    count = 0
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for hash, kind, formula in connection.execute("SELECT hash, kind, formula FROM formulas ORDER BY hash"):
+            occurrences = [
+                {"path": path, "paragraph_index": paragraph_index, "style_name": style_name}
+                for path, paragraph_index, style_name in connection.execute(
+                    "SELECT path, paragraph_index, style_name FROM occurrences WHERE hash = ? ORDER BY path, paragraph_index",
+                    (hash,),
+                )
+            ]
+            record = {"hash": hash, "kind": kind, "formula": formula, "occurrences": occurrences}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    connection.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the formulas in ODT and DOCX files.")
+    parser.add_argument("paths", nargs="+", help="ODT/DOCX files or directories to scan")
+    parser.add_argument("-d", "--index", default=FORMULA_INDEX_FILE, help="SQLite index file")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--jsonl", default=None, help="also export the index as JSONL")
+    args = parser.parse_args()
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        print(f"Error: The path {missing[0]} does not exist.")
+        return 1
+
+    start = time.perf_counter()
+    stats = update_formula_index(args.paths, args.index, args.workers)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scanned {stats['files']} files in {elapsed:.2f}s ({stats['files'] / elapsed if elapsed > 0 else 0.0:.1f} files/s): "
+        f"{stats['rescanned']} indexed, {stats['unchanged']} unchanged, {stats['failed']} failed, {stats['pruned']} removed"
+    )
+    print(f"Index {args.index}: {stats['formulas']} distinct formulas, {stats['occurrences']} occurrences")
+
+    if args.jsonl:
+        count = export_formula_index(args.index, args.jsonl)
+        print(f"Exported {count} formulas to {args.jsonl}")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
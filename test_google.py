@@ -1,4 +1,19 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
 
 api_key = ""
 cse_id = ""
@@ -6,26 +21,320 @@ cse_id = ""
 query = "多采多姿的植物"
 num_results = 10
 
-response = requests.get(
-    "https://www.googleapis.com/customsearch/v1",
-    params={
-        "key": api_key,
-        "cx": cse_id,
-        "q": query,
-        "num": num_results,
-        "lr": "lang_zh-TW",
-    },
-)
-
-response.raise_for_status()
-data = response.json()
-
-google_links = data.get("items", [])
-for google_link in google_links:
-    print("==================================================")
-    for key, value in google_link.items():
-        if isinstance(value, dict):
-            for sub_key, sub_value in value.items():
-                print(f"        {sub_key}: {sub_value}")
-        else:
-            print(f"    {key}: {value}")
+CUSTOM_SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
+DEFAULT_SEARCH_PARAMS = {"lr": "lang_zh-TW"}
+# The API returns at most 10 items per request and never more than 100 per query
+SEARCH_PAGE_SIZE = 10
+SEARCH_MAX_RESULTS = 100
+SEARCH_CONCURRENCY = 8
+SEARCH_CACHE_DIR = ".search_cache"
+SEARCH_CACHE_TTL = 24 * 60 * 60
+SEARCH_MAX_RETRIES = 5
+SEARCH_BACKOFF = 0.5
+SEARCH_MAX_BACKOFF = 30.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class SearchCache:
+    """
+    On-disk cache of search responses, one JSON file per request keyed on the URL and query parameters.
+
+    The API key is left out of the key so rotating keys does not invalidate the cache. Entries older than `ttl`
+    seconds are treated as missing.
+    """
+
+    def __init__(self, cache_dir: str = SEARCH_CACHE_DIR, ttl: float = SEARCH_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, url: str, params: dict) -> str:
+        cache_params = {name: value for name, value in params.items() if name != "key"}
+        key = json.dumps([url, cache_params], sort_keys=True, ensure_ascii=False)
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, url: str, params: dict) -> dict | None:
+        try:
+            with open(self.path(url, params), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        return entry["data"]
+
+    def put(self, url: str, params: dict, data: dict) -> None:
+        path = self.path(url, params)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "data": data}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class SearchStats:
+    queries: int = 0
+    requests: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    results: int = 0
+
+    def throughput(self) -> float:
+        return self.queries / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class SearchResult:
+    query: str
+    items: list[dict] = field(default_factory=list)
+    error: str | None = None
+
+
+class SearchClient:
+    """
+    Asynchronous Custom Search client.
+
+    Requests share one pooled HTTP session and at most `concurrency` of them are in flight at a time. Rate limits
+    (429) and transient server errors are retried with exponential backoff, honoring Retry-After when the server
+    sends one. Queries asking for more than one page are paginated with the `start` parameter.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cse_id: str,
+        base_url: str = CUSTOM_SEARCH_URL,
+        params: dict | None = None,
+        concurrency: int = SEARCH_CONCURRENCY,
+        cache: SearchCache | None = None,
+        max_retries: int = SEARCH_MAX_RETRIES,
+        backoff: float = SEARCH_BACKOFF,
+        timeout: float = 30.0,
+    ):
+        self.api_key = api_key
+        self.cse_id = cse_id
+        self.base_url = base_url
+        self.params = DEFAULT_SEARCH_PARAMS if params is None else params
+        self.concurrency = concurrency
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = SearchStats()
+        self._session = requests.Session()
+        # Keep one connection per concurrent request alive instead of reconnecting every time
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        # requests is blocking; each request in flight gets its own thread so the event loop keeps the others going
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def retry_delay(self, attempt: int, response: requests.Response | None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), SEARCH_MAX_BACKOFF)
+        # Full jitter keeps throttled requests from retrying in lockstep
+        return random.uniform(0, min(self.backoff * 2**attempt, SEARCH_MAX_BACKOFF))
+
+    async def fetch_page(self, query: str, start: int = 1, num: int = SEARCH_PAGE_SIZE) -> dict:
+        params = {**self.params, "key": self.api_key, "cx": self.cse_id, "q": query, "num": num, "start": start}
+        if self.cache is not None:
+            data = self.cache.get(self.base_url, params)
+            if data is not None:
+                self.stats.cache_hits += 1
+                return data
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                self.stats.requests += 1
+                response = None
+                try:
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, lambda: self._session.get(self.base_url, params=params, timeout=self.timeout)
+                    )
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        data = response.json()
+                        break
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt == self.max_retries:
+                        raise
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                self.stats.retries += 1
+                await asyncio.sleep(self.retry_delay(attempt, response))
+
+        if self.cache is not None:
+            self.cache.put(self.base_url, params, data)
+        return data
+
+    async def search(self, query: str, num_results: int = num_results) -> SearchResult:
+        result = SearchResult(query)
+        num_results = min(num_results, SEARCH_MAX_RESULTS)
+        try:
+            while len(result.items) < num_results:
+                start = len(result.items) + 1
+                data = await self.fetch_page(query, start, min(SEARCH_PAGE_SIZE, num_results - len(result.items)))
+                items = data.get("items", [])
+                result.items.extend(items)
+                if not items or "nextPage" not in data.get("queries", {}):
+                    break
+        except (requests.RequestException, ValueError) as e:
+            self.stats.errors += 1
+            result.error = str(e)
+        return result
+
+    async def search_many(self, queries: list[str], num_results: int = num_results) -> list[SearchResult]:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.search(query, num_results) for query in queries))
+        self.stats.queries += len(queries)
+        self.stats.results += sum(len(result.items) for result in results)
+        self.stats.elapsed += time.perf_counter() - start
+        return results
+
+
+class StubSearchHandler(BaseHTTPRequestHandler):
+    # Answers like the Custom Search API; every `rate_limit_every`-th request gets a 429
+    request_count = 0
+    rate_limit_every = 0
+    latency = 0.0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).request_count += 1
+            request_count = self.request_count
+        time.sleep(self.latency)
+        if self.rate_limit_every and request_count % self.rate_limit_every == 0:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        params = {name: values[0] for name, values in parse_qs(urlparse(self.path).query).items()}
+        start = int(params.get("start", 1))
+        num = int(params.get("num", SEARCH_PAGE_SIZE))
+        total = SEARCH_MAX_RESULTS
+        items = [
+            {
+                "title": f"{params.get('q', '')} #{index}",
+                "link": f"https://example.com/{index}",
+                "snippet": f"Result {index}",
+            }
+            for index in range(start, min(start + num, total + 1))
+        ]
+        data = {"queries": {"request": [{"startIndex": start, "count": len(items)}]}, "items": items}
+        if start + num <= total:
+            data["queries"]["nextPage"] = [{"startIndex": start + num}]
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(rate_limit_every: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    # Local stand-in for the search API; point SearchClient at server.url
+    handler = type("StubSearchHandler", (StubSearchHandler,), {"rate_limit_every": rate_limit_every, "latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.url = f"http://127.0.0.1:{server.server_port}/customsearch/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def print_search_result(result: SearchResult) -> None:
+    if result.error:
+        print(f"Error searching {result.query}: {result.error}")
+    for google_link in result.items:
+        print("==================================================")
+        for key, value in google_link.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    print(f"        {sub_key}: {sub_value}")
+            else:
+                print(f"    {key}: {value}")
+
+
+def print_search_stats(stats: SearchStats) -> None:
+    print(
+        f"{stats.queries} queries, {stats.results} results in {stats.elapsed:.2f}s "
+        f"({stats.throughput():.1f} queries/s); {stats.requests} requests, {stats.cache_hits} cache hits, "
+        f"{stats.retries} retries, {stats.errors} errors"
+    )
+
+
+async def run_searches(args) -> SearchStats:
+    server = start_stub_server(args.stub_rate_limit, args.stub_latency) if args.stub else None
+    cache = None if args.no_cache else SearchCache(args.cache_dir, args.ttl)
+    try:
+        with SearchClient(
+            args.api_key,
+            args.cse_id,
+            base_url=server.url if server else CUSTOM_SEARCH_URL,
+            concurrency=args.concurrency,
+            cache=cache,
+        ) as client:
+            results = await client.search_many(args.queries, args.num_results)
+            if not args.quiet:
+                for result in results:
+                    print_search_result(result)
+            return client.stats
+    finally:
+        if server:
+            server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the web for quiz material with the Custom Search API.")
+    parser.add_argument("queries", nargs="*", help="search queries (chapter titles)")
+    parser.add_argument("-f", "--queries-file", help="file with one query per line, added to the queries")
+    parser.add_argument("-n", "--num-results", type=int, default=num_results, help="results per query (max 100)")
+    parser.add_argument("-c", "--concurrency", type=int, default=SEARCH_CONCURRENCY, help="requests in flight")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_API_KEY", api_key))
+    parser.add_argument("--cse-id", default=os.environ.get("GOOGLE_CSE_ID", cse_id))
+    parser.add_argument("--cache-dir", default=SEARCH_CACHE_DIR, help="on-disk response cache")
+    parser.add_argument("--ttl", type=float, default=SEARCH_CACHE_TTL, help="cache lifetime in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="always query the API")
+    parser.add_argument("--stub", action="store_true", help="query a local stub server instead of the API")
+    parser.add_argument("--stub-rate-limit", type=int, default=0, help="stub answers every Nth request with 429")
+    parser.add_argument("--stub-latency", type=float, default=0.0, help="stub response delay in seconds")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print throughput")
+    args = parser.parse_args()
+
+    if args.queries_file:
+        try:
+            with open(args.queries_file, "r", encoding="utf-8") as f:
+                args.queries += [line.strip() for line in f if line.strip()]
+        except OSError as e:
+            print(f"Error reading {args.queries_file}: {e}")
+            return 1
+    if not args.queries:
+        args.queries = [query]
+
+    stats = asyncio.run(run_searches(args))
+    print_search_stats(stats)
+    return 1 if stats.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,82 +1,271 @@
+from dataclasses import dataclass, field
+import posixpath
 import sys
+from typing import Iterator
+import zipfile
 
-from odf import text, math, teletype
-from odf.element import Element
-from odf.opendocument import load
+from lxml import etree
+
+OPENDOCUMENT_NAMESPACES = {
+    'style': 'urn:oasis:names:tc:opendocument:xmlns:style:1.0',
+    'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0',
+    'draw': 'urn:oasis:names:tc:opendocument:xmlns:drawing:1.0',
+    'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
+    'xlink': 'http://www.w3.org/1999/xlink',
+    'math': 'http://www.w3.org/1998/Math/MathML',
+    'manifest': 'urn:oasis:names:tc:opendocument:xmlns:manifest:1.0',
+}
+FORMULA_MEDIA_TYPE = 'application/vnd.oasis.opendocument.formula'
+
+TEXT_P = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}p"
+TEXT_H = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}h"
+TEXT_S = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}s"
+TEXT_TAB = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}tab"
+TEXT_LINE_BREAK = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}line-break"
+TEXT_STYLE_NAME = f"{{{OPENDOCUMENT_NAMESPACES['text']}}}style-name"
+STYLE_STYLE = f"{{{OPENDOCUMENT_NAMESPACES['style']}}}style"
+STYLE_NAME = f"{{{OPENDOCUMENT_NAMESPACES['style']}}}name"
+STYLE_PARENT_STYLE_NAME = f"{{{OPENDOCUMENT_NAMESPACES['style']}}}parent-style-name"
+DRAW_OBJECT = f"{{{OPENDOCUMENT_NAMESPACES['draw']}}}object"
+TABLE_ROW = f"{{{OPENDOCUMENT_NAMESPACES['table']}}}table-row"
+XLINK_HREF = f"{{{OPENDOCUMENT_NAMESPACES['xlink']}}}href"
+MATH_MATH = f"{{{OPENDOCUMENT_NAMESPACES['math']}}}math"
+MATH_ANNOTATION = f"{{{OPENDOCUMENT_NAMESPACES['math']}}}annotation"
+MANIFEST_FILE_ENTRY = f"{{{OPENDOCUMENT_NAMESPACES['manifest']}}}file-entry"
+MANIFEST_FULL_PATH = f"{{{OPENDOCUMENT_NAMESPACES['manifest']}}}full-path"
+MANIFEST_MEDIA_TYPE = f"{{{OPENDOCUMENT_NAMESPACES['manifest']}}}media-type"
+
+
+@dataclass(slots=True)
+class SpanRecord:
+    text: str
+    # 沒有自己的樣式時為 None，表示繼承段落樣式
+    style_name: str | None
+
+
+@dataclass(slots=True)
+class ParagraphRecord:
+    index: int
+    text: str
+    style_name: str | None
+    # content.xml 中自動樣式的父樣式 (通常是 styles.xml 中的共用樣式)
+    parent_style_name: str | None
+    spans: list[SpanRecord] = field(default_factory=list)
+    object_paths: list[str] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class FormulaRecord:
+    index: int
+    # 內嵌物件的路徑 (例如 "Object 1")；直接寫在 content.xml 中的公式為 None
+    object_path: str | None
+    # StarMath 原始碼
+    annotation: str | None
+    encoding: str | None
+    paragraph_index: int | None
+
+
+def extract_text(element) -> str:
+    # 與 teletype.extractText 相同：展開 text:s、text:tab、text:line-break，並包含子元素的文字
+    parts = [element.text or ""]
+    for child in element:
+        if child.tag == TEXT_S:
+            parts.append(" " * int(child.get(f"{{{OPENDOCUMENT_NAMESPACES['text']}}}c", "1")))
+        elif child.tag == TEXT_TAB:
+            parts.append("\t")
+        elif child.tag == TEXT_LINE_BREAK:
+            parts.append("\n")
+        elif isinstance(child.tag, str):
+            parts.append(extract_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def read_manifest_media_types(odt_zip: zipfile.ZipFile) -> dict[str, str]:
+    # 各成員 (物件目錄去掉結尾的 "/") 的 media type；沒有 manifest 時回傳空 dict
+    if "META-INF/manifest.xml" not in odt_zip.NameToInfo:
+        return {}
+    media_types = {}
+    with odt_zip.open("META-INF/manifest.xml") as f:
+        for _, element in etree.iterparse(f, tag=MANIFEST_FILE_ENTRY):
+            full_path = element.get(MANIFEST_FULL_PATH, "").rstrip("/")
+            if full_path:
+                media_types[full_path] = element.get(MANIFEST_MEDIA_TYPE)
+            element.clear()
+    return media_types
+
+
+def read_formula_annotation(
+    odt_zip: zipfile.ZipFile, object_path: str
+) -> tuple[bool, str | None, str | None]:
+    # 只串流讀取物件的 content.xml，找到 annotation 就停止
+    # 回傳 (是否為公式, 原始碼, 編碼)；根元素不是 math:math 的物件 (例如圖表) 不是公式
+    member = f"{posixpath.normpath(object_path).lstrip('/')}/content.xml"
+    if member not in odt_zip.NameToInfo:
+        return False, None, None
+    with odt_zip.open(member) as f:
+        for event, element in etree.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.getparent() is None and element.tag != MATH_MATH:
+                    return False, None, None
+            elif element.tag == MATH_ANNOTATION:
+                return True, element.text, element.get("encoding")
+    return True, None, None
+
+
+def release(element):
+    # 處理完的元素與之前的兄弟節點都釋放掉，讓記憶體用量與文件大小無關
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
+
+
+def iter_odt_records(file_path: str) -> Iterator[ParagraphRecord | FormulaRecord]:
+    """
+    以 iterparse 串流走訪 ODT，依文件順序產生段落與公式的紀錄。
+
+    只需走訪 content.xml 一次；公式的 StarMath 原始碼從對應的 Object N/content.xml 讀取。
+    圖表等其他內嵌物件不算公式，不產生紀錄。
+    每個段落處理完就釋放，記憶體用量不隨文件大小成長。
+
+    Args:
+        file_path (str): .odt 檔案的路徑。
+    """
+    with zipfile.ZipFile(file_path) as odt_zip, odt_zip.open("content.xml") as content:
+        media_types = read_manifest_media_types(odt_zip)
+        parent_styles = {}
+        paragraph_index = 0
+        formula_index = 0
+        # 巢狀段落 (例如文字方塊中的段落) 歸屬於最外層的段落
+        open_paragraphs = 0
+        object_paths = []
+
+        for event, element in etree.iterparse(content, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag in (TEXT_P, TEXT_H):
+                    open_paragraphs += 1
+                continue
+
+            if tag == STYLE_STYLE:
+                parent_styles[element.get(STYLE_NAME)] = element.get(STYLE_PARENT_STYLE_NAME)
+            elif tag == DRAW_OBJECT:
+                object_path = element.get(XLINK_HREF)
+                if object_path:
+                    object_paths.append(object_path)
+                    # manifest 有記錄時依 media type 判斷，否則看物件 content.xml 的根元素
+                    media_type = media_types.get(posixpath.normpath(object_path).lstrip('/'))
+                    if media_type is not None and media_type != FORMULA_MEDIA_TYPE:
+                        continue
+                    is_formula, annotation, encoding = read_formula_annotation(odt_zip, object_path)
+                    if not is_formula:
+                        continue
+                    formula_index += 1
+                    yield FormulaRecord(
+                        index=formula_index,
+                        object_path=posixpath.normpath(object_path),
+                        annotation=annotation,
+                        encoding=encoding,
+                        paragraph_index=paragraph_index + 1 if open_paragraphs else None,
+                    )
+            elif tag == MATH_MATH:
+                annotation = element.find(f".//{MATH_ANNOTATION}")
+                formula_index += 1
+                yield FormulaRecord(
+                    index=formula_index,
+                    object_path=None,
+                    annotation=annotation.text if annotation is not None else None,
+                    encoding=annotation.get("encoding") if annotation is not None else None,
+                    paragraph_index=paragraph_index + 1 if open_paragraphs else None,
+                )
+            elif tag in (TEXT_P, TEXT_H):
+                open_paragraphs -= 1
+                if open_paragraphs:
+                    continue
+                paragraph_index += 1
+                style_name = element.get(TEXT_STYLE_NAME)
+                record = ParagraphRecord(
+                    index=paragraph_index,
+                    text=extract_text(element),
+                    style_name=style_name,
+                    parent_style_name=parent_styles.get(style_name),
+                    object_paths=object_paths,
+                )
+                # 直接寫在段落下的文字繼承段落樣式，子元素 (例如 text:span) 則有自己的樣式
+                if element.text and element.text.strip():
+                    record.spans.append(SpanRecord(element.text.strip(), None))
+                for child in element:
+                    child_text = extract_text(child).strip()
+                    if child_text:
+                        record.spans.append(SpanRecord(child_text, child.get(TEXT_STYLE_NAME)))
+                    if child.tail and child.tail.strip():
+                        record.spans.append(SpanRecord(child.tail.strip(), None))
+                object_paths = []
+                yield record
+                release(element)
+            elif tag == TABLE_ROW and not open_paragraphs:
+                release(element)
 
 
 def process_odt_document(file_path):
     """
-    載入 ODT 檔案，遍歷所有文字，檢查其樣式，並偵測公式。
+    遍歷 ODT 檔案的所有文字，檢查其樣式，並偵測公式。
 
     Args:
         file_path (str): .odt 檔案的路徑。
+
+    Returns:
+        tuple[list[ParagraphRecord], list[FormulaRecord]]: 非空段落與所有公式；無法載入時回傳 None。
     """
+    paragraphs = []
+    formulas = []
     try:
-        doc = load(file_path)
+        for record in iter_odt_records(file_path):
+            if isinstance(record, FormulaRecord):
+                formulas.append(record)
+            elif record.text.strip():  # 僅保留非空段落
+                paragraphs.append(record)
     except Exception as e:
         print(f"錯誤：無法載入檔案 {file_path}。")
         print(e)
-        return
+        return None
+    return paragraphs, formulas
+
 
+def print_odt_document(file_path, paragraphs, formulas):
     print(f"--- 開始處理文件：{file_path} ---")
 
-    # 遍歷所有段落並檢查文字和樣式
     print("\n--- 文字與樣式遍歷 ---")
-    all_paragraphs = doc.getElementsByType(text.P)
-    if not all_paragraphs:
+    if not paragraphs:
         print("文件中未找到任何段落。")
-    else:
-        for i, p in enumerate(all_paragraphs):
-            # teletype.extractText() 可以提取段落中的純文字
-            paragraph_text = teletype.extractText(p)
-            if paragraph_text.strip():  # 僅顯示非空段落
-                print(f"\n[段落 {i+1}]")
-                print(f"  純文字內容: \"{paragraph_text}\"")
-
-                # 遍歷段落內的子元素以獲取更詳細的樣式資訊
-                for child_node in p.childNodes:
-                    # 文字節點通常是 unicode 字串或 odf.text.Span 等元素
-                    node_text = teletype.extractText(child_node).strip()
-                    if not node_text:
-                        continue
+    for paragraph in paragraphs:
+        print(f"\n[段落 {paragraph.index}]")
+        print(f"  純文字內容: \"{paragraph.text}\"")
+        for span in paragraph.spans:
+            if span.style_name:
+                print(f"  - 文字片段: \"{span.text}\" -> 樣式: '{span.style_name}'")
+            else:
+                print(f"  - 文字片段: \"{span.text}\" -> (繼承段落樣式: '{paragraph.style_name}')")
 
-                    style_name = ""
-                    # 元素節點才有 style 屬性
-                    if isinstance(child_node, Element):
-                        # text:style-name 屬性定義了其樣式
-                        style_name = child_node.getAttribute("stylename")
-
-                    if style_name:
-                        print(f"  - 文字片段: \"{node_text}\" -> 樣式: '{style_name}'")
-                    else:
-                        # 如果是段落下的直接文字，它會繼承段落的樣式
-                        p_style = p.getAttribute("stylename")
-                        print(f"  - 文字片段: \"{node_text}\" -> (繼承段落樣式: '{p_style}')")
-
-    # 偵測文件中的所有公式
     print("\n--- 公式偵測 ---")
-    all_formulas = doc.getElementsByType(math.Math)
-
-    if not all_formulas:
+    if not formulas:
         print("文件中未找到任何公式。")
     else:
-        print(f"在文件中找到 {len(all_formulas)} 個公式：")
-        for i, formula_obj in enumerate(all_formulas):
-            # 公式通常以 StarMath 格式儲存在 annotation 中
-            annotation = formula_obj.getElementsByType(math.Annotation)
-            formula_content = "無法提取公式內容"
-            if annotation:
-                formula_content = teletype.extractText(annotation[0])
-
-            print(f"  [公式 {i+1}]: {formula_content}")
+        print(f"在文件中找到 {len(formulas)} 個公式：")
+        for formula in formulas:
+            print(f"  [公式 {formula.index}]: {formula.annotation or '無法提取公式內容'}")
 
     print("\n--- 文件處理完畢 ---")
 
 
 def main():
     odt_file = "test_odt.odt"
-    process_odt_document(odt_file)
+    result = process_odt_document(odt_file)
+    if result is None:
+        return 1
+    print_odt_document(odt_file, *result)
 
 
 if __name__ == "__main__":
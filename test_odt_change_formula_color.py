@@ -1,14 +1,22 @@
+import argparse
+import contextlib
+import copy
 from enum import StrEnum
+import io
 import os
-import shutil
+import posixpath
+import struct
 import sys
+import time
 import traceback
+from typing import Iterable, Iterator
 import xml.etree.ElementTree as ET
 import zipfile
 
 UNZIPPED_STYLE_FILE = 'styles.xml'
 UNZIPPED_CONTENT_FILE = 'content.xml'
 UNZIPPED_OBJECT_CONTENT_FILE = 'content.xml'
+MIMETYPE_FILE = 'mimetype'
 
 OPENDOCUMENT_NAMESPACES = {
     'style': 'urn:oasis:names:tc:opendocument:xmlns:style:1.0',
@@ -28,6 +36,226 @@ class FormulaColor(StrEnum):
     BLACK = "#000000"
 
 
+class OdtPackage:
+    """
+    In-memory view of an ODT (zip) file.
+
+    XML members are parsed on first access and kept in memory; only members marked as modified are serialized
+    again when writing. Every other member is copied raw, without decompressing or recompressing it.
+    """
+
+    def __init__(self, odt_file_path: str):
+        self.odt_file_path = odt_file_path
+        self._zip = zipfile.ZipFile(odt_file_path, 'r')
+        self._xml: dict[str, ET.Element] = {}
+        self._modified: set[str] = set()
+        self._removed: set[str] = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    @staticmethod
+    def member_name(*parts: str) -> str:
+        # Hrefs in content.xml look like "./Object 1"; zip member names have no leading "./"
+        return posixpath.normpath(posixpath.join(*parts)).lstrip('/')
+
+    def exists(self, name: str) -> bool:
+        return name not in self._removed and name in self._zip.NameToInfo
+
+    def xml(self, name: str) -> ET.Element:
+        root = self._xml.get(name)
+        if root is None:
+            if not self.exists(name):
+                raise FileNotFoundError(f"{name} does not exist in {self.odt_file_path}.")
+            with self._zip.open(name) as f:
+                root = ET.parse(f).getroot()
+            self._xml[name] = root
+        return root
+
+    def mark_modified(self, name: str):
+        self._modified.add(name)
+
+    def remove(self, name: str):
+        self._removed.add(name)
+
+    def _copy_raw(self, info: zipfile.ZipInfo, output_zip: zipfile.ZipFile):
+        # zipfile has no public raw-copy API: read the compressed bytes after the local file header
+        # and append them with a fresh header, so the member is never decompressed
+        source = self._zip.fp
+        source.seek(info.header_offset)
+        header = source.read(zipfile.sizeFileHeader)
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        source.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+        data = source.read(info.compress_size)
+
+        new_info = copy.copy(info)
+        # Sizes and CRC go into the local header, so no data descriptor follows the data
+        new_info.flag_bits &= ~0x08
+        new_info.header_offset = output_zip.fp.tell()
+        output_zip.fp.write(new_info.FileHeader())
+        output_zip.fp.write(data)
+        output_zip.filelist.append(new_info)
+        output_zip.NameToInfo[new_info.filename] = new_info
+        output_zip.start_dir = output_zip.fp.tell()
+        output_zip._didModify = True
+
+    def write(self, output_path: str):
+        # One pass over the members: mimetype first and stored, modified XML re-serialized, the rest copied raw
+        infos = [info for info in self._zip.infolist() if info.filename not in self._removed]
+        infos.sort(key=lambda info: info.filename != MIMETYPE_FILE)
+        with zipfile.ZipFile(output_path, 'w') as output_zip:
+            for info in infos:
+                if info.filename == MIMETYPE_FILE:
+                    output_zip.writestr(
+                        zipfile.ZipInfo(MIMETYPE_FILE, info.date_time),
+                        self._zip.read(info),
+                        compress_type=zipfile.ZIP_STORED,
+                    )
+                elif info.filename in self._modified:
+                    xml_bytes = ET.tostring(self._xml[info.filename], encoding="UTF-8", xml_declaration=True)
+                    output_zip.writestr(info.filename, xml_bytes, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    self._copy_raw(info, output_zip)
+
+
+class StyleGraph:
+    """
+    Style inheritance graph with memoized effective colors.
+
+    A style without its own fo:color inherits the color of its nearest ancestor that has one. Parents may be
+    declared after their children or live in another part, and every style is resolved at most once.
+    """
+
+    def __init__(self, styles: Iterable[tuple[str, ET.Element]]):
+        self.parents: dict[str, str | None] = {}
+        self.own_colors: dict[str, str | None] = {}
+        self.children: dict[str, list[str]] = {}
+        for style_name, style in styles:
+            parent_style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}parent-style-name")
+            self.parents[style_name] = parent_style_name
+            color = get_style_color_from_xml(style)
+            self.own_colors[style_name] = color.lower() if color else None
+            if parent_style_name:
+                self.children.setdefault(parent_style_name, []).append(style_name)
+        self._effective_colors: dict[str, str | None] = {}
+
+    def effective_color(self, style_name: str) -> str | None:
+        if style_name in self._effective_colors:
+            return self._effective_colors[style_name]
+
+        # Walk up until a resolved style, a style with its own color or the root, then resolve the whole chain
+        chain = []
+        seen = set()
+        color = None
+        current = style_name
+        while current is not None and current in self.parents and current not in seen:
+            if current in self._effective_colors:
+                color = self._effective_colors[current]
+                break
+            seen.add(current)
+            chain.append(current)
+            if self.own_colors[current] is not None:
+                color = self.own_colors[current]
+                break
+            current = self.parents[current]
+        # A style in an inheritance cycle without its own color resolves to no color
+        for name in chain:
+            self._effective_colors[name] = color
+        return color
+
+    def styles_with_color(self, color: str) -> set[str]:
+        color = color.lower()
+        return {style_name for style_name in self.parents if self.effective_color(style_name) == color}
+
+    def descendants(self, style_names: Iterable[str]) -> set[str]:
+        result = set()
+        pending = list(style_names)
+        while pending:
+            for child in self.children.get(pending.pop(), []):
+                if child not in result:
+                    result.add(child)
+                    pending.append(child)
+        return result
+
+
+class OdtDocumentSession:
+    """
+    Parsed view of an ODT shared by all formula transforms.
+
+    Each part is parsed once through the package; the indexes below are built on first use and stay valid
+    because transforms only change attributes and remove images, never styles, paragraphs or frames.
+    Everything is serialized once by `write`.
+    """
+
+    def __init__(self, odt_file_path: str):
+        self.package = OdtPackage(odt_file_path)
+        self._styles: dict[str, dict[str, ET.Element]] = {}
+        self._paragraphs_by_style: dict[str, list[tuple[int, ET.Element]]] | None = None
+        self._frames_by_style: dict[str, list[ET.Element]] | None = None
+        self._style_graph: StyleGraph | None = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.package.close()
+
+    @property
+    def content(self) -> ET.Element:
+        return self.package.xml(UNZIPPED_CONTENT_FILE)
+
+    def styles(self, part: str) -> dict[str, ET.Element]:
+        # Style name -> <style:style> element of one part, in document order
+        styles = self._styles.get(part)
+        if styles is None:
+            styles = {}
+            for style in self.package.xml(part).iter(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}style"):
+                style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}name")
+                if style_name:
+                    styles[style_name] = style
+            self._styles[part] = styles
+        return styles
+
+    def style_graph(self) -> StyleGraph:
+        # Common styles from styles.xml followed by the automatic styles of content.xml
+        if self._style_graph is None:
+            self._style_graph = StyleGraph(
+                [*self.styles(UNZIPPED_STYLE_FILE).items(), *self.styles(UNZIPPED_CONTENT_FILE).items()]
+            )
+        return self._style_graph
+
+    def paragraphs_by_style(self, style_names) -> list[ET.Element]:
+        # <text:p> elements using any of the styles, in document order
+        if self._paragraphs_by_style is None:
+            self._paragraphs_by_style = {}
+            paragraphs = self.content.iter(f"{{{OPENDOCUMENT_NAMESPACES['text']}}}p")
+            for position, paragraph in enumerate(paragraphs):
+                style_name = paragraph.get(f"{{{OPENDOCUMENT_NAMESPACES['text']}}}style-name")
+                self._paragraphs_by_style.setdefault(style_name, []).append((position, paragraph))
+        entries = [entry for name in set(style_names) for entry in self._paragraphs_by_style.get(name, [])]
+        return [paragraph for _, paragraph in sorted(entries, key=lambda entry: entry[0])]
+
+    def frames_by_style(self, style_name: str) -> list[ET.Element]:
+        if self._frames_by_style is None:
+            self._frames_by_style = {}
+            for frame in self.content.iter(f"{{{OPENDOCUMENT_NAMESPACES['draw']}}}frame"):
+                frame_style_name = frame.get(f"{{{OPENDOCUMENT_NAMESPACES['draw']}}}style-name")
+                self._frames_by_style.setdefault(frame_style_name, []).append(frame)
+        return self._frames_by_style.get(style_name, [])
+
+    def write(self, output_path: str):
+        self.package.write(output_path)
+
+
 def get_style_color_from_xml(style_element: ET) -> str:
     text_props = style_element.find('style:text-properties', OPENDOCUMENT_NAMESPACES)
     if text_props is not None:
@@ -36,84 +264,44 @@ def get_style_color_from_xml(style_element: ET) -> str:
     return None
 
 
-def list_color_styles_in_styles_xml(unzipped_odt_path: str, color: FormulaColor) -> list[str]:
-    # Load the styles.xml file
-    styles_file = os.path.join(unzipped_odt_path, UNZIPPED_STYLE_FILE)
-    if not os.path.exists(styles_file):
-        raise FileNotFoundError(f"Styles file {styles_file} does not exist.")
-    element = ET.parse(styles_file).getroot()
-
-    color_style_name_list = []
-    for style in element.findall('.//style:style', OPENDOCUMENT_NAMESPACES):
-        style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}name")
-        style_color = get_style_color_from_xml(style)
-        if style_color:
-            if style_color.lower() == color.value.lower():
-                style_name = style_name
-                if style_name:
-                    color_style_name_list.append(style_name)
-        else:
-            # Check if the style has a parent style with the specified color
-            parent_style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}parent-style-name")
-            if parent_style_name in color_style_name_list:
-                color_style_name_list.append(style_name)
-    return color_style_name_list
-
+def list_color_styles_in_styles_xml(session: OdtDocumentSession, color: FormulaColor) -> list[str]:
+    # Styles (common and automatic) whose own or inherited color is the specified color
+    return sorted(session.style_graph().styles_with_color(color.value))
 
-def list_objects_with_style_in_content_xml(unzipped_odt_path: str, style_name_list: list[str]):
-    # Load the content.xml file
-    content_file = os.path.join(unzipped_odt_path, UNZIPPED_CONTENT_FILE)
-    if not os.path.exists(content_file):
-        raise FileNotFoundError(f"Content file {content_file} does not exist.")
-    content_element = ET.parse(content_file).getroot()
-
-    # List styles with parent style name in style_name_list
-    for style in content_element.findall('.//style:style', OPENDOCUMENT_NAMESPACES):
-        style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}name")
-        parent_style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}parent-style-name")
-        if parent_style_name in style_name_list:
-            style_name_list.append(style_name)
 
+def list_objects_with_style_in_content_xml(session: OdtDocumentSession, style_name_list: list[str]):
     # Find all objects in text with style in style_name_list
     object_path_list = []
     object_image_path_list = []
-    for elem in content_element.findall('.//text:p', OPENDOCUMENT_NAMESPACES):
-        style_name = elem.get(f"{{{OPENDOCUMENT_NAMESPACES['text']}}}style-name")
-        if style_name in style_name_list:
-            frames = elem.findall('.//draw:frame', OPENDOCUMENT_NAMESPACES)
-            for frame in frames:
-                object = frame.find('.//draw:object', OPENDOCUMENT_NAMESPACES)
-                if object is not None:
-                    object_path = object.get(f"{{{OPENDOCUMENT_NAMESPACES['xlink']}}}href")
-                    if object_path:
-                        object_path_list.append(object_path)
-                image = frame.find('.//draw:image', OPENDOCUMENT_NAMESPACES)
-                if image is not None:
-                    image_path = image.get(f"{{{OPENDOCUMENT_NAMESPACES['xlink']}}}href")
-                    if image_path:
-                        object_image_path_list.append(image_path)
-                    frame.remove(image)
-
-    # Save the modified content.xml back to the file
-    content_xml_str = ET.tostring(content_element, encoding="UTF-8", xml_declaration=True).decode('utf-8')
-    with open(content_file, 'w', encoding='utf-8') as f:
-        f.write(content_xml_str)
+    for elem in session.paragraphs_by_style(style_name_list):
+        frames = elem.findall('.//draw:frame', OPENDOCUMENT_NAMESPACES)
+        for frame in frames:
+            object = frame.find('.//draw:object', OPENDOCUMENT_NAMESPACES)
+            if object is not None:
+                object_path = object.get(f"{{{OPENDOCUMENT_NAMESPACES['xlink']}}}href")
+                if object_path:
+                    object_path_list.append(object_path)
+            image = frame.find('.//draw:image', OPENDOCUMENT_NAMESPACES)
+            if image is not None:
+                image_path = image.get(f"{{{OPENDOCUMENT_NAMESPACES['xlink']}}}href")
+                if image_path:
+                    object_image_path_list.append(image_path)
+                frame.remove(image)
+
+    # Mark content.xml to be written back
+    session.package.mark_modified(UNZIPPED_CONTENT_FILE)
 
     # Remove the images from content.xml
     for image_path in object_image_path_list:
-        image_file = os.path.join(unzipped_odt_path, image_path)
-        if os.path.exists(image_file):
-            os.remove(image_file)
+        session.package.remove(session.package.member_name(image_path))
 
     return object_path_list
 
 
-def change_formula_color_in_object_content_xml(unzipped_odt_path: str, object_path: str, color: FormulaColor):
+def change_formula_color_in_object_content_xml(session: OdtDocumentSession, object_path: str, color: FormulaColor):
     # Load object's content.xml file
-    object_content_file = os.path.join(unzipped_odt_path, object_path, UNZIPPED_OBJECT_CONTENT_FILE)
-    if not os.path.exists(object_content_file):
-        raise FileNotFoundError(f"Content file {object_content_file} does not exist.")
-    object_content_element = ET.parse(object_content_file).getroot()
+    object_content_file = session.package.member_name(object_path, UNZIPPED_OBJECT_CONTENT_FILE)
+    object_content_element = session.package.xml(object_content_file)
 
     # Find the <semantics> element
     semantics: ET.Element = object_content_element.find("math:semantics", OPENDOCUMENT_NAMESPACES)
@@ -139,39 +327,28 @@ def change_formula_color_in_object_content_xml(unzipped_odt_path: str, object_pa
     else:
         print("No <annotation> element found in the content XML.")
 
-    # Save the modified content.xml back to the file
-    object_content_xml_str = ET.tostring(object_content_element, encoding="UTF-8", xml_declaration=True).decode("utf-8")
-    with open(object_content_file, "w", encoding="utf-8") as f:
-        f.write(object_content_xml_str)
+    # Mark the object's content.xml to be written back
+    session.package.mark_modified(object_content_file)
 
 
-def change_formula_color_if_styled_in_xmls(unzipped_odt_path: str, color: FormulaColor):
+def change_formula_color_if_styled_in_xmls(session: OdtDocumentSession, color: FormulaColor):
     # List style names with the specified color in the styles.xml
-    color_styles = list_color_styles_in_styles_xml(unzipped_odt_path, color)
+    color_styles = list_color_styles_in_styles_xml(session, color)
 
     # Find all objects in text with the specified color style in content.xml
-    red_objects = list_objects_with_style_in_content_xml(unzipped_odt_path, color_styles)
+    red_objects = list_objects_with_style_in_content_xml(session, color_styles)
 
     # Modify the object content.xml to change the color of formulas
     for obj in red_objects:
-        change_formula_color_in_object_content_xml(unzipped_odt_path, obj, color)
-
+        change_formula_color_in_object_content_xml(session, obj, color)
+    return len(red_objects)
 
-def modify_formula_style_in_content_xml(unzipped_odt_path: str, height_base_pt: int = 4.1):
-    # Load the content.xml file
-    content_file = os.path.join(unzipped_odt_path, UNZIPPED_CONTENT_FILE)
-    if not os.path.exists(content_file):
-        raise FileNotFoundError(f"Content file {content_file} does not exist.")
-    content_element = ET.parse(content_file).getroot()
 
+def modify_formula_style_in_content_xml(session: OdtDocumentSession, height_base_pt: int = 4.1):
     # List and modify styles with parent style name 'Formula'
-    formula_style_name_list = []
-    for style in content_element.findall('.//style:style', OPENDOCUMENT_NAMESPACES):
-        style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}name")
-        parent_style_name = style.get(f"{{{OPENDOCUMENT_NAMESPACES['style']}}}parent-style-name")
-        if parent_style_name == "Formula":
-            formula_style_name_list.append(style_name)
-
+    formula_styles = session.style_graph().descendants(["Formula"])
+    formula_style_name_list = [name for name in session.styles(UNZIPPED_CONTENT_FILE) if name in formula_styles]
+    for style in session.styles(UNZIPPED_CONTENT_FILE).values():
         # Set vertical-pos to "from-top" and remove vertical-rel
         graphic_properties = style.find('style:graphic-properties', OPENDOCUMENT_NAMESPACES)
         if graphic_properties is not None:
@@ -181,87 +358,200 @@ def modify_formula_style_in_content_xml(unzipped_odt_path: str, height_base_pt:
         raise ValueError("No styles with parent style name 'Formula' found in content.xml.")
 
     # Modify the frame with formula style
-    modified = False
-    for frame in content_element.findall('.//draw:frame', OPENDOCUMENT_NAMESPACES):
-        style_name = frame.get(f"{{{OPENDOCUMENT_NAMESPACES['draw']}}}style-name")
-        if style_name in formula_style_name_list:
-            # Get the height
-            height_str = frame.get(f"{{{OPENDOCUMENT_NAMESPACES['svg']}}}height")
-            if height_str is None:
-                continue
-            height_num = float(height_str[:-2])  # Remove 'pt' and convert to int
-            height_unit = height_str[-2:]  # Get the unit (should be 'pt')
-            if height_unit == "pt":
-                height_base = height_base_pt
-            elif height_unit == "cm":
-                height_base = height_base_pt * 0.0352778
-            elif height_unit == "in":
-                height_base = height_base_pt / 72.0
-            else:
-                raise ValueError(f"Unsupported unit: {height_unit}")
-            # Set frame svg:y to -(height/2 + height_base)
-            frame_y = -(height_num / 2 + height_base)
-            frame.set(f"{{{OPENDOCUMENT_NAMESPACES['svg']}}}y", f"{frame_y}{height_unit}")
-            modified = True
+    modified = 0
+    for frame in (frame for style_name in formula_style_name_list for frame in session.frames_by_style(style_name)):
+        # Get the height
+        height_str = frame.get(f"{{{OPENDOCUMENT_NAMESPACES['svg']}}}height")
+        if height_str is None:
+            continue
+        height_num = float(height_str[:-2])  # Remove 'pt' and convert to int
+        height_unit = height_str[-2:]  # Get the unit (should be 'pt')
+        if height_unit == "pt":
+            height_base = height_base_pt
+        elif height_unit == "cm":
+            height_base = height_base_pt * 0.0352778
+        elif height_unit == "in":
+            height_base = height_base_pt / 72.0
+        else:
+            raise ValueError(f"Unsupported unit: {height_unit}")
+        # Set frame svg:y to -(height/2 + height_base)
+        frame_y = -(height_num / 2 + height_base)
+        frame.set(f"{{{OPENDOCUMENT_NAMESPACES['svg']}}}y", f"{frame_y}{height_unit}")
+        modified += 1
 
     if modified:
-        # Save the modified content.xml back to the file
-        content_xml_str = ET.tostring(content_element, encoding="UTF-8", xml_declaration=True).decode("utf-8")
-        with open(content_file, "w", encoding="utf-8") as f:
-            f.write(content_xml_str)
+        # Mark content.xml to be written back
+        session.package.mark_modified(UNZIPPED_CONTENT_FILE)
     else:
         raise ValueError("No frames with formula style found in content.xml.")
-
-
-def fix_odt_formula_style(odt_file_path: str, color: FormulaColor):
-    tmp_folder = f"{os.path.basename(odt_file_path[:odt_file_path.rfind('.')])}_tmp"
-    if os.path.exists(tmp_folder):
-        # raise FileExistsError(f"Temporary folder {tmp_folder} already exists. Please remove it before proceeding.")
-        shutil.rmtree(tmp_folder)
-    os.makedirs(tmp_folder, exist_ok=True)
-
-    # Unzip the ODT file
-    with zipfile.ZipFile(odt_file_path, 'r') as zip_ref:
-        zip_ref.extractall(tmp_folder)
-
-    # Change the formula color if styled in XMLs
-    try:
-        change_formula_color_if_styled_in_xmls(tmp_folder, color)
-    except ValueError as e:
-        print(e)
-
-    # Modify the content.xml to set the formula style
-    try:
-        modify_formula_style_in_content_xml(tmp_folder)
-    except ValueError as e:
-        print(e)
-
-    # Repackage the ODT file
-    new_odt_file = odt_file_path.replace('.odt', '_modified.odt')
-    with zipfile.ZipFile(new_odt_file, 'w') as zip_ref:
-        for foldername, subfolders, filenames in os.walk(tmp_folder):
-            for filename in filenames:
-                file_path = os.path.join(foldername, filename)
-                arcname = os.path.relpath(file_path, tmp_folder)
-                zip_ref.write(file_path, arcname)
+    return modified
+
+
+def modified_odt_path(odt_file_path: str, output_dir: str | None = None) -> str:
+    # "X.ODT" -> "X_modified.ODT", optionally moved into output_dir
+    root, ext = os.path.splitext(odt_file_path)
+    path = f"{root}_modified{ext or '.odt'}"
+    return os.path.join(output_dir, os.path.basename(path)) if output_dir else path
+
+
+def fix_odt_formula_style(
+    odt_file_path: str, color: FormulaColor | Iterable[FormulaColor], output_path: str | None = None
+) -> dict:
+    # `color` may be several colors, handled in the same pass; returns the number of changed formulas and frames,
+    # and the messages of the transforms that found nothing to change
+    colors = [color] if isinstance(color, FormulaColor) else list(color)
+    stats = {"recolored": {}, "frames": 0, "errors": []}
+
+    # Parse each part once and run every transform against the same session; nothing is extracted to disk
+    with OdtDocumentSession(odt_file_path) as session:
+        # Change the formula color if styled in XMLs
+        for formula_color in colors:
+            try:
+                stats["recolored"][formula_color.name.lower()] = change_formula_color_if_styled_in_xmls(
+                    session, formula_color
+                )
+            except ValueError as e:
+                print(e)
+                stats["errors"].append(str(e))
+
+        # Modify the content.xml to set the formula style
+        try:
+            stats["frames"] = modify_formula_style_in_content_xml(session)
+        except ValueError as e:
+            print(e)
+            stats["errors"].append(str(e))
+
+        # Repackage the ODT file in one pass, serializing each modified part once. Raw members are copied
+        # from the open input, so writing over it goes through a temporary file replaced after closing it
+        new_odt_file = output_path or modified_odt_path(odt_file_path)
+        in_place = os.path.exists(new_odt_file) and os.path.samefile(new_odt_file, odt_file_path)
+        write_path = f"{new_odt_file}.{os.getpid()}.tmp" if in_place else new_odt_file
+        try:
+            session.write(write_path)
+        except BaseException:
+            if in_place and os.path.exists(write_path):
+                os.remove(write_path)
+            raise
+    if in_place:
+        os.replace(write_path, new_odt_file)
 
     # Replace the original file with the modified one
     # if os.path.exists(odt_file_path):
     #     os.remove(odt_file_path)
     # shutil.move(new_odt_file, odt_file_path)
-
-    # Clean up the temporary folder
-    shutil.rmtree(tmp_folder)
+    return stats
+
+
+def iter_odt_files(paths: Iterable[str]) -> Iterator[str]:
+    # Files are taken as given; directories are searched recursively, skipping earlier outputs
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                root, ext = os.path.splitext(filename)
+                if ext.lower() == '.odt' and not root.endswith('_modified'):
+                    yield os.path.join(dirpath, filename)
+
+
+def fix_odt_formula_style_job(odt_file_path: str, colors: list[FormulaColor], output_dir: str | None) -> dict:
+    # Runs in a worker process; everything happens in memory, so parallel jobs share no temp folders
+    output_path = modified_odt_path(odt_file_path, output_dir)
+    result = {"path": odt_file_path, "output_path": output_path, "size": 0, "elapsed": 0.0, "error": None, "errors": []}
+    # Keep the per-formula messages with the result instead of interleaving them across workers
+    messages = io.StringIO()
+    start = time.perf_counter()
+    try:
+        result["size"] = os.path.getsize(odt_file_path)
+        with contextlib.redirect_stdout(messages):
+            result.update(fix_odt_formula_style(odt_file_path, colors, output_path))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed"] = time.perf_counter() - start
+    result["messages"] = messages.getvalue().splitlines()
+    return result
+
+
+def fix_odt_formula_styles(
+    odt_file_paths: Iterable[str],
+    colors: list[FormulaColor],
+    output_dir: str | None = None,
+    max_workers: int | None = None,
+    verbose: bool = False,
+) -> list[dict]:
+    # Prints one line per file as it finishes, followed by the transform errors (or, verbose, all its messages)
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(fix_odt_formula_style_job, odt_file_path, colors, output_dir)
+            for odt_file_path in odt_file_paths
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result["error"]:
+                print(f"{result['path']}: failed ({result['error']})")
+            else:
+                recolored = ", ".join(f"{name} {count}" for name, count in result["recolored"].items())
+                print(
+                    f"{result['path']} -> {result['output_path']}: recolored [{recolored}], "
+                    f"{result['frames']} frames in {result['elapsed'] * 1000:.1f}ms"
+                )
+            for message in result["messages"] if verbose else result["errors"]:
+                print(f"    {message}")
+    return results
 
 
 def main():
-    odt_file = "test_odt.odt"
-    try:
-        fix_odt_formula_style(odt_file, FormulaColor.RED)
-    except Exception:
-        print(f"Error occurred: {traceback.format_exc()}")
-        return 1
-    print(f"The formula color in {odt_file} has been changed to {FormulaColor.RED.name.lower()}.")
+    parser = argparse.ArgumentParser(description="Recolor and reposition formulas in ODT files.")
+    parser.add_argument("paths", nargs="*", default=["test_odt.odt"], help="ODT files or directories")
+    parser.add_argument(
+        "-c",
+        "--color",
+        nargs="+",
+        choices=[color.name.lower() for color in FormulaColor],
+        default=[FormulaColor.RED.name.lower()],
+        help="formula colors to apply, in one pass",
+    )
+    parser.add_argument("-o", "--output-dir", default=None, help="directory for the modified files")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every message of each file")
+    args = parser.parse_args()
+
+    colors = [FormulaColor[name.upper()] for name in args.color]
+    odt_files = list(iter_odt_files(args.paths))
+    if len(odt_files) == 1 and args.output_dir is None:
+        odt_file = odt_files[0]
+        try:
+            fix_odt_formula_style(odt_file, colors)
+        except Exception:
+            print(f"Error occurred: {traceback.format_exc()}")
+            return 1
+        print(f"The formula color in {odt_file} has been changed to {', '.join(args.color)}.")
+        return 0
+
+    if args.output_dir:
+        names = [os.path.basename(odt_file) for odt_file in odt_files]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            print(f"Error: Several input files are named {duplicates[0]}; their outputs would collide in {args.output_dir}.")
+            return 1
+        os.makedirs(args.output_dir, exist_ok=True)
+    start = time.perf_counter()
+    results = fix_odt_formula_styles(odt_files, colors, args.output_dir, args.workers, args.verbose)
+    elapsed = time.perf_counter() - start
+
+    failed = [result for result in results if result["error"]]
+    total_mb = sum(result["size"] for result in results) / (1024 * 1024)
+    print(
+        f"Processed {len(results) - len(failed)}/{len(results)} files in {elapsed:.2f}s "
+        f"({len(results) / elapsed if elapsed > 0 else 0.0:.1f} files/s, {total_mb / elapsed if elapsed > 0 else 0.0:.1f} MB/s)"
+    )
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
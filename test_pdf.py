@@ -1,44 +1,517 @@
-import matplotlib.pyplot as plt
+from collections import OrderedDict
+import contextlib
+import hashlib
 import io
+import os
+import threading
+import time
 
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Flowable, Image
 
-def latex_to_image(latex_str):
-    fig = plt.figure()
-    text = fig.text(0, 0, f"${latex_str}$", fontsize=8)
-    fig.canvas.draw()
-    bbox = text.get_window_extent()
-    width, height = bbox.size / fig.dpi + 0.05
-    fig.set_size_inches((width, height))
+LATEX_IMAGE_CACHE_MAX_SIZE = 512
+# 每個使用者自己的快取目錄，其他使用者無法放入會被嵌進 PDF 的圖片
+LATEX_IMAGE_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "latex_image_cache"
+)
+LATEX_IMAGE_CACHE_MAX_DISK_BYTES = 256 * 1024 * 1024
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+LATEX_PATH_CACHE_MAX_SIZE = 512
+# 與 PNG 模式 (8pt、300dpi 的圖片以 72dpi 顯示) 相同的顯示大小
+VECTOR_LATEX_FONTSIZE = 8 * 300 / 72
+# 對應 PNG 模式 pad_inches=0.1 在 300dpi 下的留白，讓兩種模式縮放後的大小一致
+VECTOR_LATEX_PADDING = 0.1 * 300
+
+
+class MathMode:
+    PNG = "png"
+    VECTOR = "vector"
+
+
+def render_latex_png(latex_str, fontsize=8, dpi=300):
+    # matplotlib 匯入很慢，只在真的需要繪製公式時才載入
+    from matplotlib.figure import Figure
+
+    # 不經過 pyplot，直接用 Figure 輸出；bbox_inches='tight' 會自動裁切到公式大小，不需先 draw 一次量測
+    fig = Figure()
+    fig.text(0, 0, f"${latex_str}$", fontsize=fontsize)
     buffer = io.BytesIO()
-    plt.axis('off')
-    plt.savefig(buffer, format='png', dpi=300, bbox_inches='tight', pad_inches=0.1)
-    plt.close(fig)
-    buffer.seek(0)
-    return buffer
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight', pad_inches=0.1)
+    return buffer.getvalue()
+
+
+class LatexImageCache:
+    """
+    以 (LaTeX, 字體大小, dpi) 的雜湊為鍵的公式圖片快取。
+
+    記憶體層為 LRU，保存 PNG bytes 與共用的 ImageReader；磁碟層 (cache_dir) 讓之後的執行也不需重新繪製。
+    磁碟層超過 max_disk_bytes 時刪除最久未使用的檔案；讀寫失敗時改為直接繪製，不影響 PDF 輸出。
+    """
+
+    def __init__(
+        self,
+        max_size=LATEX_IMAGE_CACHE_MAX_SIZE,
+        cache_dir=LATEX_IMAGE_CACHE_DIR,
+        max_disk_bytes=LATEX_IMAGE_CACHE_MAX_DISK_BYTES,
+    ):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(latex_str, fontsize, dpi):
+        return hashlib.sha256(f"{fontsize}\0{dpi}\0{latex_str}".encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def _disable_disk(self, e):
+        # 磁碟層出錯 (例如沒有權限) 時只提示一次，之後這個行程都只用記憶體層
+        print(f"LaTeX 圖片快取 {self.cache_dir} 無法使用，改為直接繪製：{e}")
+        self.cache_dir = None
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                png = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self._disable_disk(e)
+            return None
+        # 更新修改時間，清理時依此判斷最近是否用過；無法更新 (例如唯讀目錄) 不影響讀到的內容
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        # 不完整或不是 PNG 的檔案視為沒有快取
+        return png if png.startswith(PNG_SIGNATURE) else None
+
+    def _disk_files(self):
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _prune_disk(self):
+        # 刪除最久未使用的檔案，直到低於上限的 80%，避免每次寫入都要清理
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_disk_bytes * 0.8:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+        self._disk_bytes = total
+
+    def _write_disk(self, key, png):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+                self._disk_bytes += len(png)
+                if self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes:
+                    self._prune_disk()
+        except OSError as e:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            self._disable_disk(e)
+
+    def _store(self, key, png):
+        # [PNG bytes, ImageReader (第一次使用時才建立)]
+        entry = [png, None]
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def lookup(self, latex_str, fontsize=8, dpi=300):
+        # 只查記憶體與磁碟，沒有快取時回傳 None 而不繪製
+        key = self.key(latex_str, fontsize, dpi)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry
+
+        png = self._read_disk(key)
+        if png is None:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return self._store(key, png)
+
+    def put(self, latex_str, png, fontsize=8, dpi=300, miss=False):
+        # 放入在其他地方 (例如預先繪製的行程池) 繪製好的 PNG；miss 表示這次是因為沒有快取才繪製
+        key = self.key(latex_str, fontsize, dpi)
+        if miss:
+            with self._lock:
+                self.misses += 1
+        self._write_disk(key, png)
+        return self._store(key, png)
+
+    def _get_entry(self, latex_str, fontsize, dpi):
+        entry = self.lookup(latex_str, fontsize, dpi)
+        if entry is not None:
+            return entry
+        return self.put(latex_str, render_latex_png(latex_str, fontsize=fontsize, dpi=dpi), fontsize, dpi, miss=True)
+
+    @staticmethod
+    def reader(entry):
+        if entry[1] is None:
+            entry[1] = ImageReader(io.BytesIO(entry[0]))
+        return entry[0], entry[1]
+
+    def get_png(self, latex_str, fontsize=8, dpi=300):
+        return self._get_entry(latex_str, fontsize, dpi)[0]
+
+    def get(self, latex_str, fontsize=8, dpi=300):
+        # 回傳 (PNG bytes, 共用的 ImageReader)
+        return self.reader(self._get_entry(latex_str, fontsize, dpi))
+
+    def stats(self):
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self._entries)}
+
+
+latex_image_cache = LatexImageCache()
+
+
+def latex_to_image(latex_str, fontsize=8, dpi=300):
+    return io.BytesIO(latex_image_cache.get_png(latex_str, fontsize=fontsize, dpi=dpi))
+
+
+class LatexImage(Image):
+    # 使用快取中共用的 ImageReader，同一個公式在整份文件只解碼一次
+    # rendered 為預先繪製好的 (PNG bytes, ImageReader)，有給就不再查快取
+    def __init__(self, latex_str, fontsize=8, dpi=300, rendered=None, **kwargs):
+        png, self._img = rendered or latex_image_cache.get(latex_str, fontsize=fontsize, dpi=dpi)
+        super().__init__(io.BytesIO(png), **kwargs)
+
+
+_latex_path_cache = OrderedDict()
+_latex_path_cache_lock = threading.Lock()
+
+
+def build_latex_path(latex_str, fontsize):
+    from matplotlib.path import Path
+    from matplotlib.textpath import TextPath
+
+    # 用 matplotlib mathtext 取得公式的字形輪廓 (單位為 pt)，轉成 PDF 路徑運算子
+    # 回傳 (運算子字串, 寬, 高)，座標已平移到原點
+    path = TextPath((0, 0), f"${latex_str}$", size=fontsize)
+    extents = path.get_extents()
+    vertices = (path.vertices - (extents.x0, extents.y0)).round(2).tolist()
+    codes = path.codes.tolist()
+
+    operators = []
+    current = (0.0, 0.0)
+    i = 0
+    while i < len(vertices):
+        code = codes[i]
+        if code == Path.MOVETO:
+            current = vertices[i]
+            operators.append(f"{current[0]:g} {current[1]:g} m")
+            i += 1
+        elif code == Path.LINETO:
+            current = vertices[i]
+            operators.append(f"{current[0]:g} {current[1]:g} l")
+            i += 1
+        elif code == Path.CURVE3:
+            # 二次貝茲曲線轉為三次
+            (cx, cy), (ex, ey) = vertices[i], vertices[i + 1]
+            c1x, c1y = current[0] + 2 / 3 * (cx - current[0]), current[1] + 2 / 3 * (cy - current[1])
+            c2x, c2y = ex + 2 / 3 * (cx - ex), ey + 2 / 3 * (cy - ey)
+            operators.append(f"{c1x:.2f} {c1y:.2f} {c2x:.2f} {c2y:.2f} {ex:g} {ey:g} c")
+            current = vertices[i + 1]
+            i += 2
+        elif code == Path.CURVE4:
+            (c1x, c1y), (c2x, c2y), (ex, ey) = vertices[i], vertices[i + 1], vertices[i + 2]
+            operators.append(f"{c1x:g} {c1y:g} {c2x:g} {c2y:g} {ex:g} {ey:g} c")
+            current = vertices[i + 2]
+            i += 3
+        elif code == Path.CLOSEPOLY:
+            operators.append("h")
+            i += 1
+        else:
+            i += 1
+    return " ".join(operators), max(extents.width, 1), max(extents.height, 1)
+
+
+def lookup_latex_path(latex_str, fontsize=VECTOR_LATEX_FONTSIZE):
+    key = (latex_str, fontsize)
+    with _latex_path_cache_lock:
+        latex_path = _latex_path_cache.get(key)
+        if latex_path is not None:
+            _latex_path_cache.move_to_end(key)
+        return latex_path
+
+
+def put_latex_path(latex_str, latex_path, fontsize=VECTOR_LATEX_FONTSIZE):
+    with _latex_path_cache_lock:
+        _latex_path_cache[(latex_str, fontsize)] = latex_path
+        while len(_latex_path_cache) > LATEX_PATH_CACHE_MAX_SIZE:
+            _latex_path_cache.popitem(last=False)
+    return latex_path
+
+
+def latex_to_path(latex_str, fontsize=VECTOR_LATEX_FONTSIZE):
+    # 依 (LaTeX, 字體大小) 快取，同一個公式在不同文件間也不必重新排版
+    latex_path = lookup_latex_path(latex_str, fontsize)
+    if latex_path is not None:
+        return latex_path
+    return put_latex_path(latex_str, build_latex_path(latex_str, fontsize), fontsize)
+
 
+class VectorLatex(Flowable):
+    """
+    以向量路徑繪製的公式。
 
+    每個不同的公式在文件中只定義一次 Form XObject，之後出現的同一公式都只引用它。
+    """
+
+    def __init__(
+        self,
+        latex_str,
+        fontsize=VECTOR_LATEX_FONTSIZE,
+        padding=VECTOR_LATEX_PADDING,
+        max_width=None,
+        max_height=None,
+        hAlign='CENTER',
+        rendered=None,
+    ):
+        Flowable.__init__(self)
+        self.hAlign = hAlign
+        self._operators, path_width, path_height = rendered or latex_to_path(latex_str, fontsize)
+        self._padding = padding
+        self._width = path_width + 2 * padding
+        self._height = path_height + 2 * padding
+        self._scale = 1.0
+        if max_width and self._width > max_width:
+            self._scale = max_width / self._width
+        if max_height and self._height * self._scale > max_height:
+            self._scale = max_height / self._height
+        self.form_name = "Latex" + LatexImageCache.key(latex_str, fontsize, "vector")[:32]
+
+    def wrap(self, availWidth, availHeight):
+        return self._width * self._scale, self._height * self._scale
+
+    def draw(self):
+        canv = self.canv
+        if not canv.hasForm(self.form_name):
+            canv.beginForm(
+                self.form_name,
+                lowerx=0,
+                lowery=0,
+                upperx=self._width - 2 * self._padding,
+                uppery=self._height - 2 * self._padding,
+            )
+            # 以非零環繞規則填滿字形輪廓
+            canv.addLiteral(f"{self._operators} f")
+            canv.endForm()
+        canv.saveState()
+        canv.scale(self._scale, self._scale)
+        canv.translate(self._padding, self._padding)
+        canv.doForm(self.form_name)
+        canv.restoreState()
+
+
+from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
-# 註冊字體
-pdfmetrics.registerFont(TTFont('Microsoft JhengHei Bold', 'microsoft-jhenghei-bold.ttf'))
-pdfmetrics.registerFont(TTFont('Microsoft JhengHei', 'microsoft-jhenghei.ttf'))
+PDF_FONTS = {
+    'Microsoft JhengHei Bold': 'microsoft-jhenghei-bold.ttf',
+    'Microsoft JhengHei': 'microsoft-jhenghei.ttf',
+}
+PDF_STYLE_FONTS = {
+    'Title': 'Microsoft JhengHei Bold',
+    'Heading2': 'Microsoft JhengHei Bold',
+    'Normal': 'Microsoft JhengHei',
+}
 
 
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet
+class PdfStyleRegistry:
+    """
+    每個行程共用的字體與樣式表。
+
+    匯入模組時不讀取字體檔；第一次需要某個字體時才解析並註冊，之後同一行程 (包含行程池的 worker) 都直接沿用。
+    ReportLab 的 TTFont 在輸出時只嵌入文件實際用到的字形 (subset)，所以 PDF 不會包含整個 CJK 字體。
+    """
+
+    def __init__(self, fonts=PDF_FONTS, style_fonts=PDF_STYLE_FONTS):
+        self.fonts = fonts
+        self.style_fonts = style_fonts
+        self._styles = None
+        self._lock = threading.Lock()
+
+    def ensure_font(self, font_name):
+        if font_name in pdfmetrics.getRegisteredFontNames():
+            return font_name
+        with self._lock:
+            if font_name not in pdfmetrics.getRegisteredFontNames():
+                pdfmetrics.registerFont(TTFont(font_name, self.fonts[font_name]))
+        return font_name
+
+    def styles(self):
+        # 樣式表只建立一次；generate_pdf 只讀取樣式，不會修改共用的物件
+        if self._styles is None:
+            styles = getSampleStyleSheet()
+            for style_name, font_name in self.style_fonts.items():
+                styles[style_name].fontName = self.ensure_font(font_name)
+            with self._lock:
+                if self._styles is None:
+                    self._styles = styles
+        return self._styles
+
+
+pdf_style_registry = PdfStyleRegistry()
+
+
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 
 
-def generate_pdf(quizzes, output_path="output.pdf"):
+def extract_formulas(text):
+    # $...$ 之間的部分即為公式 (split 後的奇數索引)
+    return [part.strip() for part in text.split('$')[1::2] if part.strip()]
+
+
+def iter_quiz_formulas(quiz, show_explanations=False):
+    # 只產生 generate_pdf 實際會繪製的公式：簡答題不顯示選項，解析只在 show_explanations 時顯示
+    yield from extract_formulas(quiz['question'])
+    if quiz['quiz_type'] == 'mcq':
+        for option in quiz['options']:
+            yield from extract_formulas(option)
+    if show_explanations:
+        yield from extract_formulas(quiz.get('explanation') or '')
+
+
+def render_formula(latex_str, math_mode):
+    # 在子行程中執行，只回傳可 pickle 的結果 (PNG bytes 或路徑運算子)
+    if math_mode == MathMode.VECTOR:
+        return build_latex_path(latex_str, VECTOR_LATEX_FONTSIZE)
+    return render_latex_png(latex_str)
+
+
+# 行程池的每個 worker 第一次繪製前都要載入 matplotlib (約 0.5 秒)；缺少的公式太少時直接在本行程繪製比較快
+PRERENDER_MIN_PARALLEL_FORMULAS = 16
+
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool(max_workers=None):
+    """
+    取得整個行程共用的繪製行程池，第一次使用時才建立。
+
+    worker 會一直保留已載入的 matplotlib，批次產生多份 PDF 時只需啟動一次；fork 出的子行程會建立自己的池。
+    """
+    global _render_pool, _render_pool_pid
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            _render_pool = ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1)
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+
+def prerender_formulas(formulas, math_mode=MathMode.PNG, max_workers=None, executor=None):
+    """
+    在組裝 story 之前，把所有不重複的公式一次繪製好。
+
+    已在快取中的公式直接取用，其餘的分散到行程池平行繪製 (matplotlib 無法在執行緒間平行)，
+    結果寫回快取並以 {公式: 繪製結果} 回傳，組裝 story 時只需查表。
+    executor 為呼叫端提供的行程池；沒有提供時使用 get_render_pool() 共用的池。
+    缺少的公式少於 PRERENDER_MIN_PARALLEL_FORMULAS 時不使用行程池。
+    """
+    rendered = {}
+    missing = []
+    for latex_str in dict.fromkeys(formulas):
+        if math_mode == MathMode.VECTOR:
+            latex_path = lookup_latex_path(latex_str)
+            if latex_path is not None:
+                rendered[latex_str] = latex_path
+                continue
+        else:
+            entry = latex_image_cache.lookup(latex_str)
+            if entry is not None:
+                rendered[latex_str] = LatexImageCache.reader(entry)
+                continue
+        missing.append(latex_str)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if executor is None and len(missing) >= PRERENDER_MIN_PARALLEL_FORMULAS and max_workers > 1:
+        executor = get_render_pool(max_workers)
+    if executor is not None and missing:
+        chunksize = max(1, len(missing) // (max_workers * 4))
+        results = list(executor.map(render_formula, missing, [math_mode] * len(missing), chunksize=chunksize))
+    else:
+        results = [render_formula(latex_str, math_mode) for latex_str in missing]
+
+    for latex_str, result in zip(missing, results):
+        if math_mode == MathMode.VECTOR:
+            rendered[latex_str] = put_latex_path(latex_str, result)
+        else:
+            rendered[latex_str] = LatexImageCache.reader(latex_image_cache.put(latex_str, result, miss=True))
+    return rendered
+
+
+def latex_flowable(latex_str, math_mode=MathMode.PNG, rendered=None, max_height=20 * mm):
+    if math_mode == MathMode.VECTOR:
+        return VectorLatex(latex_str, max_width=100 * mm, max_height=max_height, rendered=rendered)
+    img = LatexImage(latex_str, rendered=rendered)
+    img._restrictSize(100 * mm, max_height)
+    return img
+
+
+def add_formula_flowables(story, text, formulas, math_mode, max_height=20 * mm):
+    for latex_str in extract_formulas(text):
+        story.append(latex_flowable(latex_str, math_mode, formulas.get(latex_str), max_height))
+
+
+def generate_pdf(
+    quizzes,
+    output_path="output.pdf",
+    math_mode=MathMode.PNG,
+    show_explanations=False,
+    max_workers=None,
+    executor=None,
+):
+    # 回傳各階段耗時 (秒)：setup 為版面、樣式與字體，formulas 為預先繪製公式，story 為組裝內容，build 為排版輸出
+    timings = {}
+    start = time.perf_counter()
     doc = SimpleDocTemplate(
         output_path, pagesize=A4, rightMargin=20 * mm, leftMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm
     )
-    styles = getSampleStyleSheet()
-    styles['Title'].fontName = 'Microsoft JhengHei Bold'
-    styles['Heading2'].fontName = 'Microsoft JhengHei Bold'
-    styles['Normal'].fontName = 'Microsoft JhengHei'
+    styles = pdf_style_registry.styles()
     story = []
 
     # 標題
@@ -48,44 +521,73 @@ def generate_pdf(quizzes, output_path="output.pdf"):
     )
     story.append(Spacer(1, 12))
 
+    # quizzes['quizzes'] 可以是 list 或 iterator，只走訪一次並依題型分組
+    mcq_quizzes = []
+    saq_quizzes = []
+    for quiz in quizzes['quizzes']:
+        if quiz['quiz_type'] == 'mcq':
+            mcq_quizzes.append(quiz)
+        elif quiz['quiz_type'] == 'saq':
+            saq_quizzes.append(quiz)
+
+    timings['setup'] = time.perf_counter() - start
+    start = time.perf_counter()
+    # 預先平行繪製會用到的公式 (題目、選擇題選項與顯示時的解析)，之後組裝 story 只需查表
+    formulas = prerender_formulas(
+        (
+            latex_str
+            for quiz in (*mcq_quizzes, *saq_quizzes)
+            for latex_str in iter_quiz_formulas(quiz, show_explanations)
+        ),
+        math_mode=math_mode,
+        max_workers=max_workers,
+        executor=executor,
+    )
+    timings['formulas'] = time.perf_counter() - start
+    start = time.perf_counter()
+
+    def add_explanation(quiz):
+        if show_explanations and quiz.get('explanation'):
+            story.append(Paragraph(f"解析：{quiz['explanation']}", styles['Normal']))
+            add_formula_flowables(story, quiz['explanation'], formulas, math_mode)
+
     # 選擇題
     story.append(Paragraph("壹、選擇題 (每題 ___ 分。共 ____ 分)：", styles['Heading2']))
-    for idx, quiz in enumerate([q for q in quizzes['quizzes'] if q['quiz_type'] == 'mcq']):
+    for idx, quiz in enumerate(mcq_quizzes):
         story.append(Paragraph(f"{idx + 1}. {quiz['question']}", styles['Normal']))
         for opt_idx, option in enumerate(quiz['options']):
             story.append(Paragraph(f"({chr(65 + opt_idx)}) {option}", styles['Normal']))
+            add_formula_flowables(story, option, formulas, math_mode)
         # 如果有 LaTeX 方程式
-        if '$' in quiz['question']:
-            latex_str = quiz['question'].split('$')[1]
-            img_buffer = latex_to_image(latex_str)
-            img = Image(img_buffer)
-            img._restrictSize(100 * mm, 20 * mm)
-            story.append(img)
+        add_formula_flowables(story, quiz['question'], formulas, math_mode)
+        add_explanation(quiz)
         story.append(Spacer(1, 12))
 
     # 簡答題
     story.append(Paragraph("貳、簡答題 (每題 ___ 分。共 ____ 分)：", styles['Heading2']))
-    for idx, quiz in enumerate([q for q in quizzes['quizzes'] if q['quiz_type'] == 'saq']):
+    for idx, quiz in enumerate(saq_quizzes):
         story.append(Paragraph(f"{idx + 1}. {quiz['question']}", styles['Normal']))
         story.append(Spacer(1, 24))
         # 如果有 LaTeX 方程式
-        if '$' in quiz['question']:
-            latex_str = quiz['question'].split('$')[1]
-            img_buffer = latex_to_image(latex_str)
-            img = Image(img_buffer)
-            img._restrictSize(100 * mm, 20 * mm)
-            story.append(img)
+        add_formula_flowables(story, quiz['question'], formulas, math_mode)
+        add_explanation(quiz)
         story.append(Spacer(1, 12))
+    timings['story'] = time.perf_counter() - start
 
+    start = time.perf_counter()
     doc.build(story)
-
-
-import json
+    timings['build'] = time.perf_counter() - start
+    return timings
 
 
 def main():
-    with open("quizzes.json", "r", encoding="utf-8") as f:
-        quizzes = json.load(f)
+    # test_docx 會連帶載入 python-docx 與 pydantic，只有從命令列執行時才需要
+    from test_docx import iter_quizzes, read_quizzes_info
+
+    # 串流讀取題目，不需一次載入整個 quizzes.json
+    quizzes_file = "quizzes.json"
+    quizzes = read_quizzes_info(quizzes_file).model_dump()
+    quizzes['quizzes'] = (quiz.model_dump() for quiz in iter_quizzes(quizzes_file))
     generate_pdf(quizzes, output_path="demo.pdf")
 
 
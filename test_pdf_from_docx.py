@@ -1,18 +1,25 @@
-# from docx2pdf import convert
-import pypandoc
+import argparse
+from enum import StrEnum
+import os
+import sys
+import time
 
-from test_docx import main as docx_main
 
+class PdfEngine(StrEnum):
+    NATIVE = "native"
+    PANDOC = "pandoc"
 
-def main():
-    # Call the main function from test_docx to create the document
-    docx_main()
 
-    # convert("demo.docx", "demo.pdf")
+def convert_docx_with_pandoc(docx_path: str, pdf_path: str) -> None:
+    # from docx2pdf import convert
+    # Import lazily so that importing this module does not load pandoc
+    import pypandoc
+
+    # convert(docx_path, pdf_path)
     pypandoc.convert_file(
-        "demo.docx",
+        docx_path,
         "pdf",
-        outputfile="demo.pdf",
+        outputfile=pdf_path,
         extra_args=[
             "--pdf-engine=xelatex",
             "--variable=mainfont:Microsoft JhengHei",
@@ -20,6 +27,129 @@ def main():
     )
 
 
+def convert_quizzes_file(
+    quizzes_file: str,
+    pdf_path: str,
+    engine: PdfEngine = PdfEngine.PANDOC,
+    template_path: str = "template.docx",
+    math_mode: str = "png",
+) -> dict[str, float]:
+    # Returns the time spent in each stage, in seconds
+    from test_docx import Quizzes, render_document
+
+    timings = {}
+    start = time.perf_counter()
+    with open(quizzes_file, "rb") as f:
+        quizzes = Quizzes.model_validate_json(f.read())
+    timings["load"] = time.perf_counter() - start
+
+    if engine == PdfEngine.NATIVE:
+        # Render straight from the model; fonts, styles and formula caches stay warm across the batch
+        from test_pdf import generate_pdf
+
+        timings.update(generate_pdf(quizzes.model_dump(), output_path=pdf_path, math_mode=math_mode))
+        return timings
+
+    start = time.perf_counter()
+    docx_path = f"{os.path.splitext(pdf_path)[0]}.docx"
+    render_document(quizzes, template_path).save(docx_path)
+    timings["docx"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    convert_docx_with_pandoc(docx_path, pdf_path)
+    timings["pandoc"] = time.perf_counter() - start
+    return timings
+
+
+def convert_batch(
+    quizzes_files: list[str],
+    output_dir: str | None = None,
+    engine: PdfEngine = PdfEngine.PANDOC,
+    template_path: str = "template.docx",
+    math_mode: str = "png",
+    output_paths: dict[str, str] | None = None,
+) -> list[dict]:
+    # Convert many quiz files in one process so that start-up work is paid once per batch.
+    # output_paths overrides the PDF path of individual sources.
+    results = []
+    for quizzes_file in quizzes_files:
+        name = os.path.splitext(os.path.basename(quizzes_file))[0]
+        pdf_path = (output_paths or {}).get(quizzes_file) or os.path.join(
+            output_dir or os.path.dirname(quizzes_file), f"{name}.pdf"
+        )
+        result = {"source": quizzes_file, "output_path": pdf_path, "timings": {}, "error": None}
+        start = time.perf_counter()
+        try:
+            result["timings"] = convert_quizzes_file(quizzes_file, pdf_path, engine, template_path, math_mode)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["elapsed"] = time.perf_counter() - start
+        results.append(result)
+
+        stages = ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in result["timings"].items())
+        status = f"failed ({result['error']})" if result["error"] else stages
+        print(f"{quizzes_file} -> {pdf_path}: {status}")
+    return results
+
+
+DEFAULT_QUIZZES_FILE = "quizzes.json"
+# Output of the script when run without arguments, as before batch conversion existed
+DEFAULT_PDF_PATH = "demo.pdf"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert quiz banks to PDF.",
+        epilog=(
+            "By default each bank is rendered with the template .docx (kept next to the PDF) and converted with pandoc. "
+            "'-e native' skips the docx and pandoc but draws its own layout (test_pdf.generate_pdf): "
+            "no template header and no answer key. "
+            f"Without sources, {DEFAULT_QUIZZES_FILE} is converted to {DEFAULT_PDF_PATH} (or <name>.pdf in -o)."
+        ),
+    )
+    parser.add_argument(
+        "sources", nargs="*", help=f"quizzes .json files (default: {DEFAULT_QUIZZES_FILE} -> {DEFAULT_PDF_PATH})"
+    )
+    parser.add_argument("-o", "--output-dir", default=None, help="directory for the PDFs (default: next to each source)")
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=PdfEngine,
+        choices=list(PdfEngine),
+        default=PdfEngine.PANDOC,
+        help="pandoc (default): render the template .docx, then convert; native: faster direct PDF layout without template or answer key",
+    )
+    parser.add_argument("-t", "--template", default="template.docx", help="template .docx file for the pandoc engine")
+    parser.add_argument("--math-mode", choices=["png", "vector"], default="png", help="formula rendering for the native engine")
+    args = parser.parse_args()
+
+    output_paths = None
+    if not args.sources:
+        args.sources = [DEFAULT_QUIZZES_FILE]
+        if not args.output_dir:
+            output_paths = {DEFAULT_QUIZZES_FILE: DEFAULT_PDF_PATH}
+
+    missing = [source for source in args.sources if not os.path.exists(source)]
+    if missing:
+        print(f"Error: The file {missing[0]} does not exist.")
+        return 1
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = convert_batch(args.sources, args.output_dir, args.engine, args.template, args.math_mode, output_paths)
+    elapsed = time.perf_counter() - start
+
+    totals: dict[str, float] = {}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            totals[stage] = totals.get(stage, 0.0) + seconds
+    failed = [result for result in results if result["error"]]
+    print(f"Converted {len(results) - len(failed)}/{len(results)} documents in {elapsed:.2f}s")
+    for stage, seconds in totals.items():
+        print(f"    {stage}: {seconds:.3f}s")
+    return 1 if failed else 0
+
+
 if __name__ == "__main__":
-    main()
-    print("Document created successfully.")
+    sys.exit(main())